@@ -2,9 +2,9 @@ __author__ = 'alefur'
 
 from PyQt5.QtCore import Qt
 from PyQt5.QtWidgets import QVBoxLayout, QDialog, QDialogButtonBox, QTableWidget, QTableWidgetItem, QMessageBox
-from ics.utils.opdb import opDB
 from sequencePanel.dialog import Previous
-from sequencePanel.utils import visitsFromSet, spsExposure
+from sequencePanel.queries import queries
+from sequencePanel.utils.exposures import sequenceExposures
 
 
 class DataFlag(QTableWidgetItem):
@@ -109,20 +109,14 @@ class Exposures(QTableWidget):
         self.setRowCount(len(expList))
 
         for row, exp in expList.iterrows():
-            try:
-                dataFlag, notes = opDB.fetchone(f'select data_flag, notes from sps_annotation where '
-                                                f'pfs_visit_id={exp.visit} and sps_camera_id={exp.camId}')
-            except TypeError:
-                dataFlag, notes = ('', '')
-
-            dataFlag = DataFlag(dataFlag)
+            dataFlag = DataFlag(exp.dataFlag)
             expTime = round(float(exp.exptime), 3)
             self.setItem(row, 0, LockedItem(exp.visit))
             self.setItem(row, 1, LockedItem(exp.exptype))
             self.setItem(row, 2, LockedItem(str(expTime)))
             self.setItem(row, 3, LockedItem(f'{exp.arm}{exp.specNum}'))
             self.setItem(row, 4, dataFlag)
-            self.setItem(row, 5, Notes(notes, visit=exp.visit, camId=exp.camId, dataFlag=dataFlag))
+            self.setItem(row, 5, Notes(exp.notes, visit=exp.visit, camId=exp.camId, dataFlag=dataFlag))
 
         self.resizeColumnsToContents()
         self.resizeRowsToContents()
@@ -193,7 +187,7 @@ class Annotate(QDialog):
 
         for kwargs in notes:
             try:
-                opDB.insert('sps_annotation', **kwargs)
+                queries.insert('sps_annotation', **kwargs)
             except Exception as e:
                 self.panelwidget.mwindow.critical(str(e))
 
@@ -202,7 +196,6 @@ class Annotate(QDialog):
         self.expList.resizeEvent(event)
 
     def load(self, visit_set_id):
-        visits = visitsFromSet(visit_set_id)
-        expList = spsExposure(visits)
+        expList = sequenceExposures(visit_set_id)
         self.expList.setExposures(expList)
         self.expList.resizeEvent(None)
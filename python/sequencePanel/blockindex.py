@@ -0,0 +1,54 @@
+__author__ = 'alefur'
+
+
+class BlockIndex(object):
+    """ Fenwick tree over cmdRow block sizes.
+    Block start, row lookup and block resizing are O(log n), building it is O(n). """
+
+    def __init__(self, sizes):
+        self.sizes = list(sizes)
+        self.tree = [0] + self.sizes
+        self.total = sum(self.sizes)
+        self.topBit = 1 << (len(self.sizes).bit_length() - 1) if self.sizes else 0
+
+        for i in range(1, len(self.tree)):
+            j = i + (i & -i)
+            if j < len(self.tree):
+                self.tree[j] += self.tree[i]
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def start(self, pos):
+        """ First row of block pos. """
+        start = 0
+        while pos > 0:
+            start += self.tree[pos]
+            pos -= pos & -pos
+
+        return start
+
+    def size(self, pos):
+        return self.sizes[pos]
+
+    def resize(self, pos, size):
+        delta = size - self.sizes[pos]
+        self.sizes[pos] = size
+        self.total += delta
+
+        pos += 1
+        while pos < len(self.tree):
+            self.tree[pos] += delta
+            pos += pos & -pos
+
+    def locate(self, row):
+        """ Return the block containing that row and the row offset within the block. """
+        pos, bit = 0, self.topBit
+        while bit:
+            nxt = pos + bit
+            if nxt < len(self.tree) and self.tree[nxt] <= row:
+                pos = nxt
+                row -= self.tree[nxt]
+            bit >>= 1
+
+        return pos, row
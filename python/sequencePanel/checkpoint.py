@@ -0,0 +1,188 @@
+__author__ = 'alefur'
+
+import json
+import logging
+import os
+
+from sequencePanel.cmdqueue import moveBlock
+from sequencePanel.journal import Journal, readRecords
+from sequencePanel.sequence import CmdRow
+
+
+class QueueJournal(object):
+    """ Write-ahead log of the queue : every structural change and row transition is appended as a small operation,
+    on top of a snapshot of the whole queue. Every snapshotEvery operations, a new snapshot is written atomically and
+    the log starts again empty, so that load() only replays a few operations.
+    Snapshot and log share a generation number, a log is only ever replayed on top of its own snapshot.
+
+    operations : insert(pos, rows), remove(positions), move(positions, dest), reorder(order), row(pos, state)
+    """
+    snapshotEvery = 2000
+    bufferSize = 64 * 1024
+
+    def __init__(self, root=None):
+        self.root = Journal.root if root is None else root
+        os.makedirs(self.root, exist_ok=True)
+
+        self.cmdRows = None
+        self.file = None
+        self.generation = 0
+        self.nbOps = 0
+        self.dirty = False
+        self.written = dict()
+        self.order = None
+
+    @property
+    def snapshotPath(self):
+        return os.path.join(self.root, 'queue.json')
+
+    def logPath(self, generation):
+        return os.path.join(self.root, 'queue-%06d.jsonl' % generation)
+
+    def load(self):
+        """ Return rows of the last checkpoint, snapshot plus replayed log, not attached to any queue. """
+        self.generation, states = 0, []
+
+        try:
+            with open(self.snapshotPath) as snapshotFile:
+                snapshot = json.load(snapshotFile)
+            self.generation, states = snapshot['generation'], list(snapshot['rows'])
+        except OSError:
+            pass
+        except (ValueError, KeyError, TypeError) as e:
+            logging.warning('%s is damaged (%s), starting from an empty queue', self.snapshotPath, e)
+        logPath = self.logPath(self.generation)
+
+        # an operation cannot be skipped without shifting the next ones, replay stops at the first damaged one.
+        for op in readRecords(logPath, skipInvalid=False) if os.path.exists(logPath) else []:
+            try:
+                states = self.apply(states, op)
+            except (KeyError, IndexError, TypeError) as e:
+                logging.warning('%s : cannot replay %s (%s), stopping', logPath, op, e)
+                break
+
+        cmdRows = []
+        for state in states:
+            try:
+                cmdRows.append(CmdRow.fromState(state))
+            except (KeyError, TypeError, ValueError) as e:
+                logging.warning('%s : cannot restore %s (%s), skipped', self.snapshotPath, state, e)
+
+        return cmdRows
+
+    @staticmethod
+    def apply(states, op):
+        """ Return states once op is applied, states are left untouched when op cannot be applied. """
+        if op['op'] == 'insert':
+            states[op['pos']:op['pos']] = op['rows']
+        elif op['op'] == 'remove':
+            removed = set(op['positions'])
+            states = [state for pos, state in enumerate(states) if pos not in removed]
+        elif op['op'] == 'move':
+            states = moveBlock(states, op['positions'], op['dest'])
+        elif op['op'] == 'reorder':
+            states = [states[pos] for pos in op['order']]
+        elif op['op'] == 'row':
+            states[op['pos']] = op['state']
+        else:
+            raise KeyError(op['op'])
+
+        return states
+
+    def follow(self, cmdRows):
+        """ Snapshot cmdRows and log their changes from now on. """
+        self.cmdRows = cmdRows
+        self.snapshot()
+
+        cmdRows.connect('inserted', self.inserted)
+        cmdRows.connect('removed', self.removed)
+        cmdRows.connect('moved', self.moved)
+        cmdRows.connect('aboutToReorder', self.aboutToReorder)
+        cmdRows.connect('reordered', self.reordered)
+        cmdRows.connect('rowChanged', self.rowChanged)
+        # connected after the panel, so that the uid given by the reply journal on activation is logged.
+        cmdRows.connect('rowActivated', self.rowChanged)
+
+    def snapshot(self):
+        """ Write the whole queue as a new generation, then drop the previous log. """
+        states = [cmdRow.state for cmdRow in self.cmdRows]
+        generation = self.generation + 1
+        tmpPath = f'{self.snapshotPath}.tmp'
+
+        with open(tmpPath, 'w') as snapshotFile:
+            json.dump(dict(generation=generation, rows=states), snapshotFile, separators=(',', ':'), default=str)
+            snapshotFile.flush()
+            os.fsync(snapshotFile.fileno())
+
+        os.replace(tmpPath, self.snapshotPath)
+
+        if self.file is not None:
+            self.file.close()
+
+        previous = self.logPath(self.generation)
+        if os.path.exists(previous):
+            os.remove(previous)
+
+        self.generation = generation
+        self.file = open(self.logPath(generation), 'ab', buffering=QueueJournal.bufferSize)
+        self.nbOps = 0
+        self.dirty = False
+        self.written = dict([(cmdRow, state) for cmdRow, state in zip(self.cmdRows, states)])
+
+    def write(self, op, sync=False):
+        self.file.write((json.dumps(op, separators=(',', ':'), default=str) + '\n').encode())
+        self.nbOps += 1
+        self.dirty = True
+
+        if self.nbOps >= QueueJournal.snapshotEvery:
+            self.snapshot()
+        elif sync:
+            self.sync()
+
+    def sync(self):
+        if not self.dirty:
+            return
+
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.dirty = False
+
+    def close(self):
+        self.sync()
+        self.file.close()
+        self.file = None
+
+    def inserted(self, pos, cmdRows):
+        states = [cmdRow.state for cmdRow in cmdRows]
+        self.written.update(zip(cmdRows, states))
+        self.write(dict(op='insert', pos=pos, rows=states), sync=True)
+
+    def removed(self, positions, cmdRows):
+        for cmdRow in cmdRows:
+            self.written.pop(cmdRow, None)
+
+        self.write(dict(op='remove', positions=positions), sync=True)
+
+    def moved(self, positions, dest):
+        self.write(dict(op='move', positions=positions, dest=dest))
+
+    def aboutToReorder(self):
+        self.order = dict([(id(cmdRow), pos) for pos, cmdRow in enumerate(self.cmdRows)])
+
+    def reordered(self):
+        self.write(dict(op='reorder', order=[self.order[id(cmdRow)] for cmdRow in self.cmdRows]))
+        self.order = None
+
+    def rowChanged(self, cmdRow):
+        """ Log the row state if it actually changed, status transitions are synced right away. """
+        if self.cmdRows.index(cmdRow) is None:
+            return
+
+        state = cmdRow.state
+        previous = self.written.get(cmdRow)
+        if state == previous:
+            return
+
+        self.written[cmdRow] = state
+        self.write(dict(op='row', pos=cmdRow.position, state=state),
+                   sync=previous is None or previous['status'] != state['status'])
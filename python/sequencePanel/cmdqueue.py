@@ -0,0 +1,219 @@
+__author__ = 'alefur'
+
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+from sequencePanel.sequence import statusNames, statusCodes
+
+
+def moveBlock(items, positions, dest):
+    """ Move items at sorted positions as a block in front of the item which is at dest. """
+    moved = set(positions)
+    block = [items[pos] for pos in positions]
+    before = [item for pos, item in enumerate(items[:dest]) if pos not in moved]
+    after = [item for pos, item in enumerate(items[dest:], dest) if pos not in moved]
+    return before + block + after
+
+
+class CmdQueue(object):
+    """ Ordered list of CmdRow, Qt-free.
+    Observers connect callbacks to events, structural changes are announced before (aboutTo*) and after the list
+    is actually modified, so that a Qt model can wrap them in begin/end calls.
+
+    events : aboutToInsert(pos, cmdRows), inserted(pos, cmdRows),
+             aboutToRemove(positions), removed(positions, cmdRows),
+             aboutToMove(positions, dest), moved(positions, dest),
+             aboutToReorder(), reordered(),
+             rowChanged(cmdRow), rowActivated(cmdRow), rowTerminated(cmdRow)
+
+    Bulk edits (insert, remove, moveRows) run in linear time and emit a single structural notification.
+
+    Sorted positions of the rows are also kept per status and updated on each transition, so that first valid row,
+    active row and counts do not require to scan the queue. checkConsistency verifies them after every change.
+    """
+    checkConsistency = False
+
+    def __init__(self, cmdRows=None):
+        self.cmdRows = []
+        self.callbacks = defaultdict(list)
+        self.statusIndex = [[] for status in statusNames]
+
+        if cmdRows:
+            self.insert(0, cmdRows)
+
+    def __len__(self):
+        return len(self.cmdRows)
+
+    def __iter__(self):
+        return iter(self.cmdRows)
+
+    def __getitem__(self, item):
+        return self.cmdRows[item]
+
+    def __contains__(self, cmdRow):
+        return self.index(cmdRow) is not None
+
+    def index(self, cmdRow):
+        """ Return cmdRow position in O(1), None if the cmdRow is not in the queue anymore. """
+        pos = cmdRow.position
+        if pos is not None and pos < len(self.cmdRows) and self.cmdRows[pos] is cmdRow:
+            return pos
+
+    def withStatus(self, status):
+        """ Return cmdRows with that status, in queue order. """
+        return [self.cmdRows[pos] for pos in self.statusIndex[statusCodes[status]]]
+
+    def first(self, status):
+        """ Return first cmdRow with that status, None if there is none. """
+        positions = self.statusIndex[statusCodes[status]]
+        return self.cmdRows[positions[0]] if positions else None
+
+    def count(self, status):
+        return len(self.statusIndex[statusCodes[status]])
+
+    def indexStatus(self, pos, statusCode):
+        insort(self.statusIndex[statusCode], pos)
+
+    def unindexStatus(self, pos, statusCode):
+        positions = self.statusIndex[statusCode]
+        del positions[bisect_left(positions, pos)]
+
+    def rebuildIndex(self):
+        self.statusIndex = [[] for status in statusNames]
+        for pos, cmdRow in enumerate(self.cmdRows):
+            self.statusIndex[cmdRow.statusCode].append(pos)
+
+    def shiftIndex(self, start, delta):
+        """ Shift indexed positions greater or equal than start. """
+        for positions in self.statusIndex:
+            i = bisect_left(positions, start)
+            positions[i:] = [pos + delta for pos in positions[i:]]
+
+    def updateStatus(self, cmdRow, previous):
+        """ Called by cmdRow on each status transition. """
+        pos = self.index(cmdRow)
+        if pos is None or previous == cmdRow.statusCode:
+            return
+
+        self.unindexStatus(pos, previous)
+        self.indexStatus(pos, cmdRow.statusCode)
+        self.verify()
+
+    def verify(self):
+        """ Compare status indexes and positions with a full scan of the queue, only in checkConsistency mode. """
+        if not self.checkConsistency:
+            return
+
+        statusIndex = [[] for status in statusNames]
+        for pos, cmdRow in enumerate(self.cmdRows):
+            if cmdRow.position != pos:
+                raise RuntimeError(f'{cmdRow.name} position is {cmdRow.position}, expected {pos}')
+            statusIndex[cmdRow.statusCode].append(pos)
+
+        if statusIndex != self.statusIndex:
+            raise RuntimeError(f'status index is {self.statusIndex}, expected {statusIndex}')
+
+    def connect(self, event, callback):
+        self.callbacks[event].append(callback)
+
+    def emit(self, event, *args):
+        for callback in self.callbacks[event]:
+            callback(*args)
+
+    def reindex(self, start=0, stop=None):
+        """ Update cmdRow positions between start and stop. """
+        stop = len(self.cmdRows) if stop is None else stop
+        for pos in range(start, stop):
+            self.cmdRows[pos].position = pos
+
+    def append(self, cmdRow):
+        self.insert(len(self.cmdRows), [cmdRow])
+
+    def insert(self, pos, cmdRows):
+        if not cmdRows:
+            return
+
+        pos = min(max(pos, 0), len(self.cmdRows))
+
+        self.emit('aboutToInsert', pos, cmdRows)
+        for cmdRow in cmdRows:
+            cmdRow.queue = self
+        self.cmdRows[pos:pos] = cmdRows
+        self.reindex(pos)
+
+        self.shiftIndex(pos, len(cmdRows))
+        for i, cmdRow in enumerate(cmdRows):
+            self.indexStatus(pos + i, cmdRow.statusCode)
+        self.verify()
+
+        self.emit('inserted', pos, cmdRows)
+
+    def positions(self, cmdRows):
+        """ Return sorted positions of the cmdRows which are in the queue. """
+        return sorted(set([self.index(cmdRow) for cmdRow in cmdRows]) - {None})
+
+    def copy(self, cmdRows):
+        """ Return fresh copies of cmdRows, in queue order. """
+        return [self.cmdRows[pos].copy() for pos in self.positions(cmdRows)]
+
+    def remove(self, cmdRows):
+        """ Remove cmdRows, active ones excepted since their replies are still to come. Removed rows are detached. """
+        positions = self.positions([cmdRow for cmdRow in cmdRows if not cmdRow.isActive])
+        if not positions:
+            return
+
+        self.emit('aboutToRemove', positions)
+        removed = set(positions)
+        cmdRows = [self.cmdRows[pos] for pos in positions]
+        self.cmdRows = [cmdRow for pos, cmdRow in enumerate(self.cmdRows) if pos not in removed]
+        self.reindex(positions[0])
+
+        self.rebuildIndex()
+        self.verify()
+
+        self.emit('removed', positions, cmdRows)
+
+        for cmdRow in cmdRows:
+            cmdRow.queue = cmdRow.position = None
+
+    def moveRows(self, cmdRows, dest):
+        """ Move cmdRows as a block, keeping their order, in front of the row which is at dest before the move. """
+        positions = self.positions(cmdRows)
+        dest = min(max(dest, 0), len(self.cmdRows))
+
+        # a contiguous block dropped anywhere within or right after itself stays where it is.
+        if not positions or (positions[-1] - positions[0] + 1 == len(positions) and
+                             positions[0] <= dest <= positions[-1] + 1):
+            return
+
+        self.emit('aboutToMove', positions, dest)
+        self.cmdRows = moveBlock(self.cmdRows, positions, dest)
+        self.reindex(min(positions[0], dest))
+
+        self.rebuildIndex()
+        self.verify()
+
+        self.emit('moved', positions, dest)
+
+    def reorder(self, cmdRows):
+        """ Replace queue order by cmdRows order, which must hold the same rows. """
+        if [self.index(cmdRow) for cmdRow in cmdRows] != list(range(len(self.cmdRows))):
+            if set(map(id, cmdRows)) != set(map(id, self.cmdRows)):
+                raise ValueError('reorder requires the same rows')
+
+            self.emit('aboutToReorder')
+            self.cmdRows = list(cmdRows)
+            self.reindex()
+
+            self.rebuildIndex()
+            self.verify()
+
+            self.emit('reordered')
+
+    def move(self, cmdRow, newPos):
+        """ Move a single cmdRow so that it ends up at newPos. """
+        pos = self.index(cmdRow)
+        if pos is None:
+            return
+
+        self.moveRows([cmdRow], newPos if newPos < pos else newPos + 1)
@@ -0,0 +1,67 @@
+__author__ = 'alefur'
+
+import re
+from collections import namedtuple, defaultdict
+
+SequenceInfo = namedtuple('SequenceInfo', ['id', 'seqtype', 'name', 'comments', 'cmdStr', 'dbname'])
+SubCommandInfo = namedtuple('SubCommandInfo', ['id', 'cmdStr', 'didFail', 'returnStr', 'visit', 'cameraMask'])
+
+fileids = re.compile(r'fileids=(-?\d+),([^,;]*),([^,;\s]*)')
+
+
+class DecoderRegistry(object):
+    """ Map keyword names to (decoder, handler), decoder turns keyword values into a structured output and handler
+    is the CmdRow method applying it. Keywords without decoder and values a decoder fails on are counted. """
+
+    def __init__(self):
+        self.decoders = dict()
+        self.unknown = defaultdict(int)
+        self.unparsed = defaultdict(int)
+
+    def register(self, name, handler):
+        """ Register the decorated function as decoder for keyword name. """
+
+        def wrapper(decoder):
+            self.decoders[name] = decoder, handler
+            return decoder
+
+        return wrapper
+
+    def decode(self, name, values):
+        """ Return (handler, decoded), None if keyword is unknown or could not be parsed. """
+        try:
+            decoder, handler = self.decoders[name]
+        except KeyError:
+            self.unknown[name] += 1
+            return None
+
+        try:
+            return handler, decoder(*values)
+        except (TypeError, ValueError):
+            self.unparsed[name] += 1
+            return None
+
+
+registry = DecoderRegistry()
+
+
+@registry.register('sps_sequence', handler='setSequenceInfo')
+def spsSequence(sequenceId, seqtype, cmdStr, name, comments, status, *args):
+    return SequenceInfo(int(sequenceId), seqtype, name, comments, cmdStr, '')
+
+
+@registry.register('sequence', handler='setSequenceInfo')
+def sequence(sequenceId, groupId, seqtype, name, comments, cmdStr, status, output, *args):
+    return SequenceInfo(int(sequenceId), seqtype, name, comments, cmdStr, '')
+
+
+@registry.register('experiment', handler='setSequenceInfo')
+def experiment(dbname, experimentId, seqtype, cmdStr, name, comments):
+    return SequenceInfo(int(experimentId), seqtype, name, comments, cmdStr, dbname)
+
+
+@registry.register('subCommand', handler='updateSubCommand')
+def subCommand(expId, subId, cmdStr, didFail, returnStr):
+    match = fileids.search(returnStr)
+    visit, cameraMask = (int(match.group(1)), match.group(3)) if match else (-1, '')
+    return SubCommandInfo(int(subId), cmdStr, int(didFail), returnStr, visit, cameraMask)
@@ -0,0 +1,82 @@
+__author__ = 'alefur'
+
+import heapq
+from collections import defaultdict
+
+terminalStatus = ['finished', 'failed', 'cancelled']
+
+
+def parseDepends(text):
+    """ Parse 'label1, !label2' into [(label1, 'finished'), (label2, 'failed')], '!' meaning only if it failed. """
+    depends = []
+    for label in filter(None, [label.strip() for label in text.split(',')]):
+        depends.append((label[1:].strip(), 'failed') if label.startswith('!') else (label, 'finished'))
+
+    return depends
+
+
+def formatDepends(depends):
+    return ', '.join([label if status == 'finished' else f'!{label}' for label, status in depends])
+
+
+class DependencyGraph(object):
+    """ Rows of a queue linked by their declared dependencies, rows are referred to by their label.
+    A row is ready when all its predecessors terminated with the required status, it can never run if one of them
+    terminated otherwise or does not exist. """
+
+    def __init__(self, cmdRows):
+        self.cmdRows = list(cmdRows)
+        self.labels = dict([(cmdRow.label, cmdRow) for cmdRow in self.cmdRows if cmdRow.label])
+
+    def predecessors(self, cmdRow):
+        return [self.labels.get(label) for label, status in cmdRow.depends]
+
+    def state(self, cmdRow):
+        """ Return 'ready', 'waiting' or 'never'. """
+        waiting = False
+
+        for label, status in cmdRow.depends:
+            predecessor = self.labels.get(label)
+            if predecessor is None:
+                return 'never'
+
+            if predecessor.status in terminalStatus:
+                if predecessor.status != status:
+                    return 'never'
+            else:
+                waiting = True
+
+        return 'waiting' if waiting else 'ready'
+
+    def unknown(self):
+        """ Return (cmdRow, label) for every dependency on a label which is not in the queue. """
+        return [(cmdRow, label) for cmdRow in self.cmdRows for label, status in cmdRow.depends
+                if label not in self.labels]
+
+    def topological(self):
+        """ Return rows in topological order, keeping queue order between independent rows, and rows left in or
+        behind a cycle. """
+        order = dict([(cmdRow, i) for i, cmdRow in enumerate(self.cmdRows)])
+        indegree = dict([(cmdRow, 0) for cmdRow in self.cmdRows])
+        successors = defaultdict(list)
+
+        for cmdRow in self.cmdRows:
+            for predecessor in self.predecessors(cmdRow):
+                if predecessor is not None:
+                    successors[predecessor].append(cmdRow)
+                    indegree[cmdRow] += 1
+
+        heap = [order[cmdRow] for cmdRow in self.cmdRows if not indegree[cmdRow]]
+        heapq.heapify(heap)
+        sortedRows = []
+
+        while heap:
+            cmdRow = self.cmdRows[heapq.heappop(heap)]
+            sortedRows.append(cmdRow)
+            for successor in successors[cmdRow]:
+                indegree[successor] -= 1
+                if not indegree[successor]:
+                    heapq.heappush(heap, order[successor])
+
+        cyclic = [cmdRow for cmdRow in self.cmdRows if indegree[cmdRow]]
+        return sortedRows, cyclic
@@ -1,8 +1,8 @@
 __author__ = 'alefur'
 
 from PyQt5.QtWidgets import QGridLayout, QVBoxLayout, QDialog, QDialogButtonBox, QGroupBox
-from ics.utils.opdb import opDB
 from sequencePanel.sequence import CmdRow
+from sequencePanel.queries import queries
 from sequencePanel.utils import stripQuotes, stripField
 from sequencePanel.widgets import Label, LineEdit, ComboBox, SpinBox
 
@@ -272,7 +272,7 @@ class Previous(SequenceLayout):
         self.addWidget(Label('cmdOutput'), 6, 0)
         self.addWidget(self.cmdOutput, 6, 1)
 
-        [max_iic_sequence_id] = opDB.fetchone('select max(iic_sequence_id) from iic_sequence')
+        [max_iic_sequence_id] = queries.fetchone('lastSequenceId')
         self.sequenceId.setRange(1, max_iic_sequence_id)
         self.sequenceId.valueChanged.connect(self.load)
         self.sequenceId.setValue(max_iic_sequence_id)
@@ -282,11 +282,9 @@ class Previous(SequenceLayout):
         return self.seqtypeWidget.text()
 
     def load(self):
-        query = f'select sequence_type, name, comments, cmd_str, status_flag, cmd_output from iic_sequence ' \
-                f'inner join iic_sequence_status on iic_sequence.iic_sequence_id=iic_sequence_status.iic_sequence_id ' \
-                f'where iic_sequence.iic_sequence_id={self.sequenceId.value()} '
         try:
-            seqtype, name, comments, cmdStr, status_flag, cmd_output = opDB.fetchone(query)
+            seqtype, name, comments, cmdStr, status_flag, cmd_output = queries.fetchone('sequence',
+                                                                                       self.sequenceId.value())
             self.seqtypeWidget.setText(seqtype)
             self.name.setText(name)
             self.comments.setText(comments)
@@ -393,6 +391,6 @@ class Dialog(QDialog):
         comments = str(self.seqLayout.comments.text())
         cmdStr = str(self.seqLayout.cmdStr.text())
 
-        cmdRow = CmdRow(self.panelwidget, name, comments, cmdStr, seqtype=seqtype)
+        cmdRow = CmdRow(name, comments, cmdStr, seqtype=seqtype)
 
         self.panelwidget.add(cmdRow=cmdRow)
@@ -0,0 +1,286 @@
+__author__ = 'alefur'
+
+import heapq
+import time
+from collections import defaultdict
+from datetime import datetime as dt
+from itertools import count
+
+from sequencePanel.dependencies import DependencyGraph
+from sequencePanel.resources import Resources
+from sequencePanel.retry import RetryPolicies
+
+
+class TimerQueue(object):
+    """ Time-ordered callbacks, kept in a heap with a single reactor call armed on the earliest one.
+    Nothing runs while waiting, whatever the number of entries. """
+
+    def __init__(self, reactor):
+        self.reactor = reactor
+        self.heap = []
+        self.counter = count()
+        self.cancelled = set()
+        self.call = None
+
+    def schedule(self, t, callback):
+        """ Call callback at timestamp t, return a key to cancel it. """
+        key = next(self.counter)
+        heapq.heappush(self.heap, (t, key, callback))
+
+        if self.heap[0][1] == key:
+            self.arm()
+
+        return key
+
+    def cancel(self, key):
+        if key is not None:
+            self.cancelled.add(key)
+
+    def arm(self):
+        while self.heap and self.heap[0][1] in self.cancelled:
+            self.cancelled.discard(heapq.heappop(self.heap)[1])
+
+        if self.call is not None and self.call.active():
+            self.call.cancel()
+
+        self.call = None
+        if self.heap:
+            self.call = self.reactor.callLater(max(0, self.heap[0][0] - time.time()), self.fire)
+
+    def fire(self):
+        self.call = None
+
+        while self.heap and self.heap[0][0] <= time.time():
+            t, key, callback = heapq.heappop(self.heap)
+            if key in self.cancelled:
+                self.cancelled.discard(key)
+                continue
+
+            callback()
+
+        self.arm()
+
+
+class DeadTime(object):
+    """ Idle time between the completion of a sequence and the dispatch of the next one, accumulated per night.
+    A night is named after the local date at its start. """
+
+    def __init__(self):
+        self.nights = defaultdict(lambda: [0, 0.0, 0.0])
+
+    @staticmethod
+    def night(t):
+        return dt.fromtimestamp(t - 12 * 3600).date().isoformat()
+
+    def add(self, tend, tsent):
+        night, deadTime = self.night(tend), tsent - tend
+        stats = self.nights[night]
+        stats[0] += 1
+        stats[1] += deadTime
+        stats[2] = max(stats[2], deadTime)
+        return night, deadTime, stats
+
+
+class SchedulerEngine(object):
+    """ Queue execution state machine, Qt-free and driven by the twisted reactor.
+    Valid rows are activated up to lanes at a time when their resources do not conflict and their dependencies are
+    met, activated rows are dispatched by whoever observes the queue rowActivated event. In lowLatency mode the next
+    row is dispatched gap seconds after completion, directly from the completion reply when gap is 0.
+    Failed rows are queued again according to their retry policy, unless the queue is being aborted.
+
+    states : off, waiting, processing
+    events : stateChanged(state), waiting(tstart), dispatched(cmdRows), deadTime(night, deadTime, stats),
+             retried(cmdRow, retryRow)
+    """
+    delayCmd = 2
+    lowLatency = False
+    gap = 0
+    lanes = 1
+    retryPolicies = RetryPolicies()
+
+    def __init__(self, cmdRows, reactor, sendCommand):
+        self.cmdRows = cmdRows
+        self.sendCommand = sendCommand
+        self.callbacks = defaultdict(list)
+        self.timers = TimerQueue(reactor)
+        self.deadTime = DeadTime()
+
+        self.state = 'off'
+        self.doAbort = False
+        self.pending = None
+        self.tend = None
+
+        self.cmdRows.connect('rowTerminated', self.rowTerminated)
+
+    @property
+    def validated(self):
+        """ Number of rows waiting for execution. """
+        return self.cmdRows.count('valid')
+
+    @property
+    def activated(self):
+        """ First active row, None if there is none. """
+        return self.cmdRows.first('active')
+
+    def connect(self, event, callback):
+        self.callbacks[event].append(callback)
+
+    def emit(self, event, *args):
+        for callback in self.callbacks[event]:
+            callback(*args)
+
+    def setState(self, state):
+        self.state = state
+        self.emit('stateChanged', state)
+
+    def check(self):
+        """ Return why the queue cannot be started, None if it can. """
+        if not self.validated:
+            return 'No valid sequence has been scheduled...'
+
+        graph = DependencyGraph(self.cmdRows)
+        __, cyclic = graph.topological()
+        if cyclic:
+            return 'Dependency cycle between %s...' % ', '.join([cmdRow.label or cmdRow.name for cmdRow in cyclic])
+
+        unknown = graph.unknown()
+        if unknown:
+            return 'Unknown dependencies : %s...' % ', '.join([label for cmdRow, label in unknown])
+
+    def start(self, tstart=None):
+        """ Start processing at timestamp tstart, delayCmd from now by default. """
+        if self.activated:
+            self.activate()
+            return
+
+        self.waitUntil(time.time() + SchedulerEngine.delayCmd if tstart is None else tstart)
+
+    def activate(self):
+        self.pending = None
+
+        started, tnext = self.fillLanes()
+
+        if started:
+            self.emit('dispatched', started)
+
+            if self.tend is not None:
+                self.emit('deadTime', *self.deadTime.add(self.tend, time.time()))
+                self.tend = None
+
+        if tnext is not None:
+            self.waitUntil(tnext)
+        elif self.activated is not None:
+            self.setState('processing')
+        else:
+            self.stop()
+
+    def fillLanes(self):
+        """ Activate valid rows whose dependencies are met, in queue order, while lanes are free.
+        A row may start only if its resources do not conflict with active rows nor with valid rows ahead of it which
+        could not start yet. Rows whose dependencies can no longer be met are cancelled.
+        Return activated rows and the earliest start time still pending. """
+        graph = DependencyGraph(self.cmdRows)
+        held = [Resources.fromCmdStr(cmdRow.cmdStr) for cmdRow in self.cmdRows.withStatus('active')]
+        free = SchedulerEngine.lanes - len(held)
+        started, tnext = [], None
+
+        for cmdRow in self.cmdRows.withStatus('valid'):
+            if free <= 0:
+                break
+
+            state = graph.state(cmdRow)
+            if state == 'never':
+                cmdRow.setStatus('cancelled')
+                continue
+            elif state == 'waiting':
+                continue
+
+            resources = Resources.fromCmdStr(cmdRow.cmdStr)
+            blocked = any([resources.conflicts(other) for other in held])
+            held.append(resources)
+
+            if blocked:
+                continue
+
+            if not cmdRow.isDue:
+                tnext = cmdRow.startAt if tnext is None else min(tnext, cmdRow.startAt)
+                if SchedulerEngine.lanes == 1:
+                    break
+                continue
+
+            cmdRow.setActive()
+            started.append(cmdRow)
+            free -= 1
+
+        return started, tnext
+
+    def rowTerminated(self, cmdRow):
+        # the retry must be queued before next rows are activated, so that its dependencies wait for it.
+        if not self.doAbort:
+            self.retry(cmdRow)
+
+        self.nextSVP()
+
+    def retry(self, cmdRow):
+        """ Queue a new attempt of a failed row if its retry policy allows it. """
+        policy = SchedulerEngine.retryPolicies.policy(cmdRow)
+        if policy is None or not policy.applies(cmdRow) or self.cmdRows.index(cmdRow) is None:
+            return
+
+        retryRow = cmdRow.retryCopy(startAt=time.time() + policy.delay(cmdRow.attempt))
+        self.cmdRows.insert(cmdRow.position + 1 if policy.requeue == 'head' else len(self.cmdRows), [retryRow])
+        retryRow.setValid()
+
+        self.emit('retried', cmdRow, retryRow)
+
+    def nextSVP(self, delay=None):
+        self.tend = time.time()
+
+        # abort and finish stay latched until every lane is done, nothing is dispatched nor retried meanwhile.
+        if self.doAbort:
+            if self.activated is None:
+                self.stop()
+                self.doAbort = False
+            return
+
+        if not (self.validated or self.activated):
+            self.stop()
+            return
+
+        if not self.validated:
+            self.setState('processing')
+            return
+
+        if delay is None:
+            delay = SchedulerEngine.gap if SchedulerEngine.lowLatency else SchedulerEngine.delayCmd
+
+        if delay <= 0:
+            self.activate()
+        else:
+            self.waitUntil(self.tend + delay)
+
+    def waitUntil(self, tstart):
+        """ Activate next valid rows at timestamp tstart. """
+        self.timers.cancel(self.pending)
+
+        self.setState('waiting' if self.activated is None else 'processing')
+        self.emit('waiting', tstart)
+        self.pending = self.timers.schedule(tstart, self.activate)
+
+    def stop(self):
+        self.timers.cancel(self.pending)
+        self.pending = None
+        self.tend = None
+        self.setState('off')
+
+    def abort(self):
+        self.sendCommand(fullCmd='iic sps abortExposure', timeLim=10)
+        self.doAbort = True
+
+    def finish(self):
+        self.sendCommand(fullCmd='iic sps finishExposure', timeLim=10)
+        self.doAbort = True
+
+    def finishNow(self):
+        self.sendCommand(fullCmd='iic sps finishExposure now', timeLim=10)
+        self.doAbort = True
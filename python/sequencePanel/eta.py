@@ -0,0 +1,163 @@
+__author__ = 'alefur'
+
+import json
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from statistics import median
+
+from sequencePanel.sequence import statusCodes
+from sequencePanel.utils import parseOptions
+
+
+class DurationModel(object):
+    """ Visit cycle time (exposure start to next exposure start) as a linear function of exptime, per sequence type.
+    Regression sums are accumulated from finished iic sequences in opDB and cached locally with the last sequence id
+    seen, so that each update only fetches new sequences. """
+    cachePath = os.path.expanduser('~/.sequencePanel/eta.json')
+    defaultOverhead = 60
+    historyDays = 90
+    allTypes = '*'
+
+    def __init__(self, cachePath=None):
+        self.cachePath = DurationModel.cachePath if cachePath is None else cachePath
+        self.sums = defaultdict(lambda: [0, 0.0, 0.0, 0.0, 0.0])
+        self.lastSequenceId = 0
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.cachePath) as cacheFile:
+                cache = json.load(cacheFile)
+        except (OSError, ValueError):
+            return
+
+        self.lastSequenceId = cache['lastSequenceId']
+        self.sums.update(cache['sums'])
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.cachePath), exist_ok=True)
+        with open(self.cachePath, 'w') as cacheFile:
+            json.dump(dict(lastSequenceId=self.lastSequenceId, sums=self.sums), cacheFile)
+
+    def add(self, seqtype, exptime, cycle):
+        for key in [seqtype, DurationModel.allTypes]:
+            sums = self.sums[key]
+            sums[0] += 1
+            sums[1] += exptime
+            sums[2] += cycle
+            sums[3] += exptime * exptime
+            sums[4] += exptime * cycle
+
+    def cycle(self, seqtype, exptime):
+        """ Expected visit cycle time, from the sequence type fit, all types otherwise. """
+        for key in [seqtype, DurationModel.allTypes]:
+            if key not in self.sums:
+                continue
+
+            n, sx, sy, sxx, sxy = self.sums[key]
+            variance = n * sxx - sx * sx
+
+            if n > 1 and variance > 1e-6:
+                slope = (n * sxy - sx * sy) / variance
+                return max(exptime, (sy - slope * sx) / n + slope * exptime)
+
+            return max(exptime, sy / n - sx / n + exptime)
+
+        return exptime + DurationModel.defaultOverhead
+
+    def query(self, queries):
+        """ Return visits of the sequences which finished OK since last fit, no older than historyDays, safe to call
+        from a thread. """
+        since = datetime.utcnow() - timedelta(days=DurationModel.historyDays)
+        return queries.fetchall('finishedVisits', self.lastSequenceId, since)
+
+    def fit(self, rows):
+        """ Accumulate visit cycle times from query rows, the last visit of a sequence gets the median readout. """
+        sequences = defaultdict(list)
+        for sequenceId, seqtype, visit, start, end, exptime in rows:
+            sequences[sequenceId, seqtype].append((start, end, float(exptime)))
+
+        readouts = [nxt[0] - cur[1] for visits in sequences.values() for cur, nxt in zip(visits, visits[1:])]
+        readout = median([gap.total_seconds() for gap in readouts]) if readouts else DurationModel.defaultOverhead
+
+        for (sequenceId, seqtype), visits in sequences.items():
+            for cur, nxt in zip(visits, visits[1:] + [None]):
+                cycle = (nxt[0] - cur[0]).total_seconds() if nxt else (cur[1] - cur[0]).total_seconds() + readout
+                self.add(seqtype, cur[2], cycle)
+
+            self.lastSequenceId = max(self.lastSequenceId, sequenceId)
+
+        self.save()
+
+
+class QueueETA(object):
+    """ Remaining time of each row and expected end times along the queue, active and valid rows being run one after
+    the other, gap seconds apart. Remaining times are cached per row and only recomputed when the row changed. """
+    terminal = [statusCodes[status] for status in ['finished', 'failed', 'cancelled']]
+    pending = [statusCodes[status] for status in ['valid', 'active']]
+
+    def __init__(self, cmdRows, model, gap=0):
+        self.cmdRows = cmdRows
+        self.model = model
+        self.gap = gap
+        self.remainings = dict()
+        self.end = None
+
+        for event in ['inserted', 'removed', 'rowChanged']:
+            self.cmdRows.connect(event, self.invalidate)
+
+    def invalidate(self, *args):
+        cmdRows = args[-1] if isinstance(args[-1], list) else [args[-1]]
+        for cmdRow in cmdRows:
+            self.remainings.pop(cmdRow, None)
+
+    def planned(self, cmdRow):
+        """ Number of visits and exptime from cmdStr, duplicate times the number of exposure times.
+        A cmdStr which cannot be parsed counts as a single visit, ie the overhead only. """
+        kwargs = parseOptions(cmdRow.cmdStr)
+        try:
+            exptimes = [float(exptime) for exptime in kwargs.get('exptime', '0').split(',')]
+            return int(kwargs.get('duplicate', 1)) * len(exptimes), max(exptimes)
+        except ValueError:
+            return 1, 0.0
+
+    def remaining(self, cmdRow):
+        try:
+            return self.remainings[cmdRow]
+        except KeyError:
+            pass
+
+        if cmdRow.statusCode in QueueETA.terminal:
+            remaining = 0
+        else:
+            nVisits, exptime = self.planned(cmdRow)
+            seqtype = cmdRow.seqtype if cmdRow.seqtype else ''.join(cmdRow.cmdStr.split()[1:2])
+            if cmdRow.subcommands:
+                done = sum([len(cmdRow.subIndex[code]) for code in QueueETA.terminal])
+                nVisits = len(cmdRow.subcommands) - done
+
+            remaining = nVisits * self.model.cycle(seqtype, exptime)
+
+        self.remainings[cmdRow] = remaining
+        return remaining
+
+    def update(self, now=None):
+        """ Set cmdRow.eta for pending rows, to the minute, return rows whose eta changed. """
+        now = time.time() if now is None else now
+        changed = []
+        t = now
+
+        for cmdRow in self.cmdRows:
+            eta = None
+            if cmdRow.statusCode in QueueETA.pending:
+                t += self.remaining(cmdRow) + (self.gap if cmdRow.statusCode != statusCodes['active'] else 0)
+                eta = round(t / 60) * 60
+
+            if eta != cmdRow.eta:
+                cmdRow.eta = eta
+                changed.append(cmdRow)
+
+        self.end = t if t > now else None
+        return changed
@@ -0,0 +1,123 @@
+__author__ = 'alefur'
+
+import argparse
+import os
+import time
+from functools import partial
+
+import yaml
+from sequencePanel.cmdqueue import CmdQueue
+from sequencePanel.engine import SchedulerEngine
+from sequencePanel.journal import Journal
+from sequencePanel.reply import ReplyPipeline
+from sequencePanel.retry import RetryPolicies
+from sequencePanel.sequence import CmdRow, statusNames
+
+
+class HeadlessPanel(object):
+    """ Queue, reply pipeline and scheduler engine without any display, activated rows are sent through actor.cmdr.
+    Meant to run a script as a daemon, or to load the engine with synthetic queues. """
+    callCodes = None
+
+    def __init__(self, reactor, actor, journal=None):
+        self.actor = actor
+        self.journal = journal
+        self.cmdRows = CmdQueue()
+        self.replies = ReplyPipeline()
+
+        if journal is not None:
+            self.replies.subscribe(journal.reply)
+        self.replies.subscribe(self.handleReply)
+
+        self.engine = SchedulerEngine(self.cmdRows, reactor, self.sendCommand)
+        self.cmdRows.connect('rowActivated', self.activateRow)
+
+    def handleReply(self, reply, cmdRow):
+        if cmdRow is not None:
+            cmdRow.handleReply(reply)
+
+    def activateRow(self, cmdRow):
+        if self.journal is not None:
+            self.journal.row(cmdRow)
+
+        self.sendCommand(fullCmd=cmdRow.fullCmd,
+                         timeLim=7 * 24 * 3600,
+                         callFunc=partial(self.replies, cmdRow=cmdRow))
+
+    def sendCommand(self, fullCmd, timeLim=300, callFunc=None):
+        callFunc = self.replies if callFunc is None else callFunc
+        [actor, cmdStr] = fullCmd.split(' ', 1)
+
+        self.actor.cmdr.bgCall(actor=actor, cmdStr=cmdStr, timeLim=timeLim, callFunc=callFunc,
+                               callCodes=self.callCodes)
+
+    def load(self, filepath):
+        """ Append rows of a yaml script, validated. """
+        with open(os.path.expandvars(filepath), 'r') as cfgFile:
+            cmdRows = [CmdRow(**kwargs) for i, kwargs in yaml.load(cfgFile, Loader=yaml.FullLoader).items()]
+
+        for cmdRow in cmdRows:
+            cmdRow.setValid()
+
+        self.cmdRows.insert(len(self.cmdRows), cmdRows)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('filepath', type=str, help='yaml script')
+    parser.add_argument('--simulate', action='store_true', help='answer iic commands locally, no hub connection')
+    parser.add_argument('--script', default=None, type=str, nargs='?', help='journal segment replayed by simulation')
+    parser.add_argument('--speed', default=1, type=float, nargs='?', help='simulation time acceleration factor')
+    parser.add_argument('--lowLatency', action='store_true', help='dispatch next sequence right after completion')
+    parser.add_argument('--gap', default=0, type=float, nargs='?', help='gap between sequences in lowLatency mode (s)')
+    parser.add_argument('--lanes', default=1, type=int, nargs='?', help='maximum number of concurrent sequences')
+    parser.add_argument('--retry', default=None, type=str, nargs='?', help='retry policies per sequence type (yaml)')
+    parser.add_argument('--journal', default=None, type=str, nargs='?', help='reply journal directory')
+
+    args = parser.parse_args()
+    SchedulerEngine.lowLatency = args.lowLatency
+    SchedulerEngine.gap = args.gap
+    SchedulerEngine.lanes = args.lanes
+    SchedulerEngine.retryPolicies = RetryPolicies.load(args.retry)
+
+    from twisted.internet import reactor
+
+    if args.simulate:
+        import sequencePanel.simActor as simActor
+        actor = simActor.connectActor(reactor, script=args.script, speed=args.speed)
+    else:
+        import opscore.actor.keyvar as keyvar
+        import sequencePanel.miniActor as miniActor
+        actor = miniActor.connectActor([])
+        HeadlessPanel.callCodes = keyvar.AllCodes
+
+    journal = None
+    if args.journal is not None:
+        journal = Journal(args.journal)
+        journal.load()
+
+    panel = HeadlessPanel(reactor, actor, journal=journal)
+    panel.load(args.filepath)
+
+    error = panel.engine.check()
+    if error is not None:
+        raise RuntimeError(error)
+
+    panel.engine.connect('stateChanged', lambda state: reactor.stop() if state == 'off' else None)
+    start = time.time()
+    reactor.callWhenRunning(panel.engine.start, start)
+    reactor.run()
+
+    actor.disconnectActor()
+    if journal is not None:
+        journal.close()
+
+    print('elapsed=%.3f %s' % (time.time() - start, ' '.join(['%s=%d' % (status, panel.cmdRows.count(status))
+                                                              for status in statusNames])))
+    for night, (nSequences, total, longest) in panel.engine.deadTime.nights.items():
+        print('night=%s nSequences=%d deadTime=%.3f max=%.3f' % (night, nSequences, total, longest))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+__author__ = 'alefur'
+
+import json
+import logging
+import mmap
+import os
+import time
+
+number = (int, float)
+# fields every journal record must hold, with their types.
+recordFields = dict(row=dict(t=number, uid=int, info=dict, seqtype=str),
+                    cmd=dict(t=number, actor=str, text=str),
+                    reply=dict(t=number, uid=(int, type(None)), actor=str, code=str, keywords=list, text=str))
+
+
+def decodeLines(lines, path, skipInvalid):
+    """ Decode lines one by one, a line which is not a JSON record is logged then skipped, or ends the records. """
+    records = []
+
+    for i, line in enumerate(lines):
+        try:
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError('not a record')
+        except ValueError as e:
+            logging.warning('%s line %d is damaged (%s), %s', path, i + 1, e, 'skipped' if skipInvalid else 'stopping')
+            if skipInvalid:
+                continue
+            break
+
+        records.append(record)
+
+    return records
+
+
+def readRecords(path, skipInvalid=True, truncate=True):
+    """ Return the records of a JSON lines file, a last line cut by a crash is ignored, and truncated away if truncate.
+    Damaged lines, eg zeroed blocks after a power loss, never raise, see decodeLines. """
+    records = []
+
+    with open(path, 'r+b' if truncate else 'rb') as segment:
+        size = os.fstat(segment.fileno()).st_size
+        if size:
+            with mmap.mmap(segment.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                end = mm.rfind(b'\n') + 1
+                # one decoder call for the whole file, lines are turned into a JSON array.
+                if end:
+                    content = mm[:end - 1]
+                    try:
+                        records = json.loads(b'[' + content.replace(b'\n', b',') + b']')
+                        if not all([isinstance(record, dict) for record in records]):
+                            raise ValueError('not a record')
+                    except ValueError:
+                        records = decodeLines(content.split(b'\n'), path, skipInvalid)
+
+            # next records start on a clean line.
+            if truncate and end != size:
+                segment.truncate(end)
+
+    return records
+
+
+def isRecord(record):
+    """ True if record has a known type and every field of that type. """
+    fields = recordFields.get(record.get('type'))
+    return fields is not None and all([isinstance(record.get(key), types) for key, types in fields.items()])
+
+
+class Journal(object):
+    """ Append-only journal of the replies received by the panel, as JSON lines in rotating segments.
+    Writes go through a large file buffer, sync() flushes and fsyncs it, and is called periodically and whenever a
+    command completes. On restart, load() maps the latest segment and returns its records in order, records missing
+    a field are skipped. Only the keepSegments latest segments are kept.
+
+    records : row(t, uid, info, seqtype), cmd(t, actor, text),
+              reply(t, uid, actor, code, keywords, text) with keywords as [name, values] pairs, uid is None for
+              replies which do not belong to a queued row.
+    """
+    root = os.path.expanduser('~/.sequencePanel/journal')
+    segmentSize = 64 * 1024 * 1024
+    keepSegments = 8
+    bufferSize = 256 * 1024
+
+    def __init__(self, root=None):
+        self.root = Journal.root if root is None else root
+        os.makedirs(self.root, exist_ok=True)
+
+        self.file = None
+        self.size = 0
+        self.dirty = False
+        self.nextUid = 0
+        self.rows = dict()
+
+    @property
+    def segments(self):
+        return sorted([os.path.join(self.root, filename) for filename in os.listdir(self.root) if
+                       filename.startswith('journal-') and filename.endswith('.jsonl')])
+
+    def segmentPath(self, index):
+        return os.path.join(self.root, 'journal-%06d.jsonl' % index)
+
+    def open(self, path):
+        self.file = open(path, 'ab', buffering=Journal.bufferSize)
+        self.size = self.file.tell()
+
+    def rotate(self):
+        """ Start a new segment, rows activated so far are declared again so that it can be loaded on its own. """
+        segments = self.segments
+        index = int(os.path.basename(segments[-1])[8:-6]) + 1 if segments else 0
+
+        if self.file is not None:
+            self.close()
+
+        self.open(self.segmentPath(index))
+        self.prune()
+
+        for uid, (info, seqtype) in self.rows.items():
+            self.write(dict(type='row', t=time.time(), uid=uid, info=info, seqtype=seqtype))
+
+    def prune(self):
+        """ Remove the oldest segments, keeping the keepSegments latest ones. """
+        for path in self.segments[:-Journal.keepSegments]:
+            os.remove(path)
+
+    def load(self):
+        """ Return records of the latest segment and resume writing at its end. """
+        segments = self.segments
+        if not segments:
+            self.rotate()
+            return []
+
+        path = segments[-1]
+        records = []
+
+        for i, record in enumerate(readRecords(path)):
+            if not isRecord(record):
+                logging.warning('%s record %d is incomplete, skipped', path, i + 1)
+                continue
+
+            records.append(record)
+
+            if record['type'] == 'row':
+                self.rows[record['uid']] = record['info'], record['seqtype']
+                self.nextUid = max(self.nextUid, record['uid'] + 1)
+
+        self.open(path)
+        return records
+
+    def write(self, record):
+        line = (json.dumps(record, separators=(',', ':'), default=str) + '\n').encode()
+        self.file.write(line)
+        self.size += len(line)
+        self.dirty = True
+
+        if self.size >= Journal.segmentSize:
+            self.rotate()
+
+    def sync(self):
+        if not self.dirty:
+            return
+
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.dirty = False
+
+    def close(self):
+        self.sync()
+        self.file.close()
+        self.file = None
+
+    def row(self, cmdRow):
+        """ Declare cmdRow, giving it the uid its replies are journaled with. """
+        if cmdRow.uid is None:
+            cmdRow.uid = self.nextUid
+            self.nextUid += 1
+
+        info, seqtype = cmdRow.info, cmdRow.seqtype
+        self.rows[cmdRow.uid] = info, seqtype
+        self.write(dict(type='row', t=time.time(), uid=cmdRow.uid, info=info, seqtype=seqtype))
+
+    def cmd(self, actor, text):
+        self.write(dict(type='cmd', t=time.time(), actor=actor, text=text))
+
+    def reply(self, reply, cmdRow=None):
+        self.write(dict(type='reply', t=reply.t, uid=None if cmdRow is None else cmdRow.uid, actor=reply.actor,
+                        code=reply.code, keywords=list(reply.keywords.items()), text=reply.text))
+
+        if reply.isFinal:
+            self.sync()
@@ -1,13 +1,17 @@
 __author__ = 'alefur'
 
 import os
+import time
+from bisect import bisect_left
 from datetime import datetime as dt
 from functools import partial
 
 import sequencePanel
-from PyQt5.QtGui import QFont, QTextCursor
-from PyQt5.QtWidgets import QPlainTextEdit, QGridLayout, QVBoxLayout
-from sequencePanel.widgets import PushButton
+from PyQt5.QtCore import Qt, QAbstractListModel, QModelIndex, QTimer
+from PyQt5.QtGui import QFont, QColor
+from PyQt5.QtWidgets import QListView, QGridLayout, QVBoxLayout, QHBoxLayout, QAbstractItemView, QWidget
+from sequencePanel.logstore import LogFilter, LogStore
+from sequencePanel.widgets import PushButton, ComboBox, LineEdit, Label
 
 imgpath = os.path.abspath(os.path.join(os.path.dirname(sequencePanel.__file__), '../..', 'img'))
 
@@ -17,6 +21,7 @@ class LogLayout(QVBoxLayout):
         QGridLayout.__init__(self)
         self.panelwidget = panelwidget
         self.logArea = CmdLogArea()
+        self.filterBar = LogFilterBar(self.logArea)
 
         self.showButton = PushButton('Show Logs')
         self.hideButton = PushButton('Hide Logs')
@@ -25,6 +30,7 @@ class LogLayout(QVBoxLayout):
 
         self.panelwidget.scheduler.addWidget(self.showButton, 1, 10)
         self.panelwidget.scheduler.addWidget(self.hideButton, 1, 11)
+        self.addWidget(self.filterBar)
         self.addWidget(self.logArea)
         self.show(False)
 
@@ -35,15 +41,94 @@ class LogLayout(QVBoxLayout):
         except:
             scrollValue = 0
 
-        offset = self.logArea.fixedHeight + 5
+        offset = self.logArea.fixedHeight + LogFilterBar.fixedHeight + 10
         height += (offset if bool else -offset)
         self.showButton.setVisible(not bool)
         self.hideButton.setVisible(bool)
+        self.filterBar.setVisible(bool)
         self.logArea.setVisible(bool)
         self.panelwidget.adjust(width, height, scrollValue)
 
 
-class CmdLogArea(QPlainTextEdit):
+class LogModel(QAbstractListModel):
+    """ List model over the log store, showing the records matching the current filter.
+    Without filter rows map directly to the retained window, otherwise to the selected sequence numbers. """
+
+    def __init__(self, capacity):
+        QAbstractListModel.__init__(self)
+        self.store = LogStore(capacity)
+        self.logFilter = LogFilter()
+        self.rows = None
+        self.head = 0
+        self.colors = dict([(code, QColor(color)) for code, color in CmdLogArea.colorCode.items()])
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+
+        return len(self.store) if self.rows is None else len(self.rows) - self.head
+
+    def seq(self, row):
+        return self.store.first + row if self.rows is None else self.rows[self.head + row]
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+
+        timestamp, actor, code, keywords, text = self.store.record(self.seq(index.row()))
+
+        if role == Qt.DisplayRole:
+            return '%s  %s' % (dt.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S'), text)
+
+        if role == Qt.ForegroundRole:
+            return self.colors.get(code, self.colors['i'])
+
+    def setFilter(self, logFilter):
+        """ Switch view selection, only the indexes of the store are used. """
+        self.beginResetModel()
+        self.logFilter = logFilter
+        self.rows = None if logFilter.isEmpty else self.store.select(logFilter)
+        self.head = 0
+        self.endResetModel()
+
+    def extend(self, records):
+        """ Append a batch of records, emitting one removal for evicted rows and one insertion for matching ones. """
+        records = records[-self.store.capacity:]
+        nDropped = self.store.overflow(len(records))
+
+        if self.rows is None:
+            nRemoved = nDropped
+        else:
+            nRemoved = bisect_left(self.rows, self.store.first + nDropped, self.head) - self.head
+
+        if nRemoved:
+            self.beginRemoveRows(QModelIndex(), 0, nRemoved - 1)
+            self.store.drop(nDropped)
+            self.head += nRemoved
+            self.endRemoveRows()
+        else:
+            self.store.drop(nDropped)
+
+        if self.rows is not None and self.head > len(self.rows) // 2:
+            self.rows, self.head = self.rows[self.head:], 0
+
+        matching = records if self.rows is None else [record for record in records
+                                                      if self.logFilter.match(*record[1:])]
+        if not matching:
+            for record in records:
+                self.store.append(*record)
+            return
+
+        first = self.rowCount()
+        self.beginInsertRows(QModelIndex(), first, first + len(matching) - 1)
+        for record in records:
+            seq = self.store.append(*record)
+            if self.rows is not None and self.logFilter.match(*record[1:]):
+                self.rows.append(seq)
+        self.endInsertRows()
+
+
+class CmdLogArea(QListView):
     printLevels = {'D': 0, '>': 0,
                    'I': 1, ':': 1,
                    'W': 2,
@@ -56,36 +141,125 @@ class CmdLogArea(QPlainTextEdit):
                  'f': '#FF0000',
                  '!': '#FF0000', }
     fixedHeight = 190
+    capacity = 10000
+    flushPeriod = 100
 
     def __init__(self):
-        QPlainTextEdit.__init__(self)
+        QListView.__init__(self)
         self.setMinimumSize(720, 180)
-        self.printLevel = CmdLogArea.printLevels['I']
-        self.setMaximumBlockCount(10000)
-        self.setReadOnly(True)
+        self.setModel(LogModel(CmdLogArea.capacity))
+        self.setUniformItemSizes(True)
+        self.setSelectionMode(QAbstractItemView.ExtendedSelection)
+
+        self.pending = []
+        self.flushTimer = QTimer(self)
+        self.flushTimer.setSingleShot(True)
+        self.flushTimer.setInterval(CmdLogArea.flushPeriod)
+        self.flushTimer.timeout.connect(self.flush)
+        self.setPrintLevel(CmdLogArea.printLevels['I'])
 
         self.setStyleSheet("background-color: black;color:white;")
         self.setFont(QFont("Monospace", 8))
         self.setFixedHeight(CmdLogArea.fixedHeight)
 
-    def newLine(self, newLine, code=None):
+    @property
+    def store(self):
+        return self.model().store
+
+    def codes(self, printLevel):
+        """ Reply codes shown for that printLevel, everything is stored anyway. """
+        if printLevel <= 0:
+            return None
+
+        return set([code.lower() for code, level in CmdLogArea.printLevels.items() if level >= printLevel])
+
+    def setPrintLevel(self, printLevel):
+        self.printLevel = printLevel
+        self.setFilter()
+
+    def setFilter(self, actor=None, keyword=None, search=None):
+        self.flush()
+        self.model().setFilter(LogFilter(actor=actor, codes=self.codes(self.printLevel), keyword=keyword,
+                                         search=search))
+        self.scrollToBottom()
+
+    def newLine(self, newLine, code=None, actor='', keywords=()):
         code = 'i' if code is None else code
-        color = CmdLogArea.colorCode[code]
-        self.appendHtml('\n<font color="%s">%s  %s</font>' % (color, dt.now().strftime('%Y-%m-%d %H:%M:%S'), newLine))
+        self.pending.append((time.time(), actor, code, keywords, newLine))
+
+        if not self.flushTimer.isActive():
+            self.flushTimer.start()
+
+    def load(self, records):
+        """ Append records restored from the journal in one batch. """
+        self.pending.extend(records)
+        self.flush()
+
+    def flush(self):
+        """ Append pending records in a single batch and scroll once. """
+        if not self.pending:
+            return
+
+        records, self.pending = self.pending, []
+        self.model().extend(records)
+        self.scrollToBottom()
+
+    def record(self, reply):
+        code = reply.code.lower()
+        return reply.t, reply.actor, code, reply.names, '%s %s %s ' % (reply.actor, code, reply.text)
+
+    def printReply(self, reply, cmdRow=None):
+        self.pending.append(self.record(reply))
+
+        if not self.flushTimer.isActive():
+            self.flushTimer.start()
+
+
+class LogFilterBar(QWidget):
+    """ Switch the log view between actors, levels and keywords, and search within the retained window. """
+    fixedHeight = 24
+    levels = dict(debug=0, info=1, warning=2, failure=3)
+
+    def __init__(self, logArea):
+        QWidget.__init__(self)
+        self.logArea = logArea
+
+        self.actor = ComboBox()
+        self.actor.addItem('all')
+        self.level = ComboBox()
+        self.level.addItems(list(LogFilterBar.levels.keys()))
+        self.level.setCurrentText('info')
+        self.keyword = LineEdit()
+        self.search = LineEdit()
+
+        layout = QHBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        for label, widget in [('actor', self.actor), ('level', self.level), ('keyword', self.keyword),
+                              ('search', self.search)]:
+            layout.addWidget(Label(label))
+            layout.addWidget(widget)
 
-        self.moveCursor(QTextCursor.End)
-        self.ensureCursorVisible()
+        self.setLayout(layout)
+        self.setFixedHeight(LogFilterBar.fixedHeight)
 
-    def formatResponse(self, actor, code, keywords):
-        color = CmdLogArea.colorCode[code]
-        return '<font color="%s">%s %s %s</font>' % (color, actor, code, keywords)
+        self.actor.activated.connect(self.apply)
+        self.level.activated.connect(self.apply)
+        self.keyword.editingFinished.connect(self.apply)
+        self.search.textChanged.connect(self.apply)
+        self.logArea.model().rowsInserted.connect(self.updateActors)
 
-    def printResponse(self, resp):
-        reply = resp.replyList[-1]
-        code = resp.lastCode
+    def updateActors(self, *args):
+        actors = sorted([actor for actor in self.logArea.store.byActor if actor])
+        known = [self.actor.itemText(i) for i in range(1, self.actor.count())]
+        if actors != known:
+            current = self.actor.currentText()
+            self.actor.clear()
+            self.actor.addItems(['all'] + actors)
+            self.actor.setCurrentText(current)
 
-        if CmdLogArea.printLevels[code] >= self.printLevel:
-            self.newLine(newLine='%s %s %s ' % (reply.header.actor,
-                                                reply.header.code.lower(),
-                                                reply.keywords.canonical(delimiter=';')),
-                         code=reply.header.code.lower())
+    def apply(self, *args):
+        actor = self.actor.currentText()
+        self.logArea.printLevel = LogFilterBar.levels[self.level.currentText()]
+        self.logArea.setFilter(actor=None if actor in ['all', ''] else actor,
+                               keyword=self.keyword.text().strip() or None,
+                               search=self.search.text() or None)
@@ -0,0 +1,107 @@
+__author__ = 'alefur'
+
+from collections import defaultdict, deque
+from heapq import merge
+
+
+class LogFilter(object):
+    """ Log view selection, None means no constraint. codes is the set of accepted reply codes. """
+    __slots__ = ('actor', 'codes', 'keyword', 'search')
+
+    def __init__(self, actor=None, codes=None, keyword=None, search=None):
+        self.actor = actor
+        self.codes = codes
+        self.keyword = keyword
+        self.search = search
+
+    @property
+    def isEmpty(self):
+        return self.actor is None and self.codes is None and self.keyword is None and not self.search
+
+    def match(self, actor, code, keywords, text):
+        return (self.actor is None or actor == self.actor) and \
+               (self.codes is None or code in self.codes) and \
+               (self.keyword is None or self.keyword in keywords) and \
+               (not self.search or self.search in text)
+
+
+class LogStore(object):
+    """ Columnar ring buffer of log records, indexed by actor, code and keyword name.
+    Each record gets an increasing sequence number, the retained window is [first, total). Index deques only hold
+    sequence numbers in increasing order, so evicting the oldest record pops from their left side. """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.timestamps = [0.0] * capacity
+        self.actors = [''] * capacity
+        self.codes = [''] * capacity
+        self.keywords = [()] * capacity
+        self.texts = [''] * capacity
+        self.first = 0
+        self.total = 0
+
+        self.byActor = defaultdict(deque)
+        self.byCode = defaultdict(deque)
+        self.byKeyword = defaultdict(deque)
+
+    def __len__(self):
+        return self.total - self.first
+
+    def overflow(self, nRecords):
+        """ Number of oldest records which would be evicted by appending nRecords. """
+        return max(0, len(self) + min(nRecords, self.capacity) - self.capacity)
+
+    def unindex(self, index, key):
+        index[key].popleft()
+        if not index[key]:
+            del index[key]
+
+    def drop(self, nRecords):
+        """ Evict the nRecords oldest records. """
+        for seq in range(self.first, self.first + nRecords):
+            slot = seq % self.capacity
+            self.unindex(self.byActor, self.actors[slot])
+            self.unindex(self.byCode, self.codes[slot])
+            for keyword in self.keywords[slot]:
+                self.unindex(self.byKeyword, keyword)
+
+        # columns are not erased, slots are overwritten by the next appends.
+        self.first += nRecords
+
+    def append(self, timestamp, actor, code, keywords, text):
+        if len(self) == self.capacity:
+            self.drop(1)
+
+        seq = self.total
+        slot = seq % self.capacity
+        self.timestamps[slot] = timestamp
+        self.actors[slot] = actor
+        self.codes[slot] = code
+        self.keywords[slot] = keywords
+        self.texts[slot] = text
+        self.total += 1
+
+        self.byActor[actor].append(seq)
+        self.byCode[code].append(seq)
+        for keyword in keywords:
+            self.byKeyword[keyword].append(seq)
+
+        return seq
+
+    def record(self, seq):
+        slot = seq % self.capacity
+        return self.timestamps[slot], self.actors[slot], self.codes[slot], self.keywords[slot], self.texts[slot]
+
+    def select(self, logFilter):
+        """ Return sequence numbers matching logFilter, starting from the smallest index available. """
+        candidates = []
+
+        if logFilter.actor is not None:
+            candidates.append(self.byActor.get(logFilter.actor, ()))
+        if logFilter.keyword is not None:
+            candidates.append(self.byKeyword.get(logFilter.keyword, ()))
+        if logFilter.codes is not None:
+            candidates.append(list(merge(*[self.byCode.get(code, ()) for code in logFilter.codes])))
+
+        seqs = min(candidates, key=len) if candidates else range(self.first, self.total)
+        return [seq for seq in seqs if logFilter.match(*self.record(seq)[1:])]
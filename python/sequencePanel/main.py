@@ -7,7 +7,11 @@ import sys
 
 from PyQt5.QtWidgets import QApplication
 from PyQt5.QtWidgets import QMainWindow, QMessageBox
+from sequencePanel.journal import Journal
 from sequencePanel.panelwidget import PanelWidget
+from sequencePanel.engine import SchedulerEngine
+from sequencePanel.retry import RetryPolicies
+from sequencePanel.table import SequenceModel
 
 
 class SequencePanel(QMainWindow):
@@ -31,10 +35,21 @@ class SequencePanel(QMainWindow):
         return QMessageBox.critical(self, 'Warning', message, QMessageBox.Ok, QMessageBox.Cancel)
 
     def closeEvent(self, QCloseEvent):
+        self.centralWidget().journal.close()
+        self.centralWidget().checkpoint.close()
         self.reactor.callFromThread(self.reactor.stop)
         QCloseEvent.accept()
 
 
+def positive(value):
+    """ argparse type of strictly positive rates. """
+    rate = float(value)
+    if rate <= 0:
+        raise argparse.ArgumentTypeError(f'{value} is not strictly positive')
+
+    return rate
+
+
 def main():
     app = QApplication(sys.argv)
 
@@ -42,8 +57,28 @@ def main():
 
     parser.add_argument('--name', default=pwd.getpwuid(os.getuid()).pw_name, type=str, nargs='?', help='cmdr name')
     parser.add_argument('--stretch', default=0.6, type=float, nargs='?', help='window stretching factor')
+    parser.add_argument('--refreshRate', default=30, type=positive, nargs='?', help='maximum table refresh rate (Hz)')
+    parser.add_argument('--lowLatency', action='store_true', help='dispatch next sequence right after completion')
+    parser.add_argument('--gap', default=0, type=float, nargs='?', help='gap between sequences in lowLatency mode (s)')
+    parser.add_argument('--lanes', default=1, type=int, nargs='?', help='maximum number of concurrent sequences')
+    parser.add_argument('--simulate', action='store_true', help='answer iic commands locally, no hub connection')
+    parser.add_argument('--script', default=None, type=str, nargs='?', help='journal segment replayed by simulation')
+    parser.add_argument('--speed', default=1, type=float, nargs='?', help='simulation time acceleration factor')
+    parser.add_argument('--retry', default=None, type=str, nargs='?', help='retry policies per sequence type (yaml)')
+    parser.add_argument('--journal', default=None, type=str, nargs='?',
+                        help='reply journal and queue checkpoint directory, apart from the real one when simulating')
 
     args = parser.parse_args()
+    SequenceModel.refreshRate = args.refreshRate
+    if args.journal is not None:
+        Journal.root = args.journal
+    elif args.simulate:
+        # a simulated session must never be restored by the real panel.
+        Journal.root = os.path.join(Journal.root, 'simulate')
+    SchedulerEngine.lowLatency = args.lowLatency
+    SchedulerEngine.gap = args.gap
+    SchedulerEngine.lanes = args.lanes
+    SchedulerEngine.retryPolicies = RetryPolicies.load(args.retry)
 
     geometry = app.desktop().screenGeometry()
     import qt5reactor
@@ -51,9 +86,12 @@ def main():
     qt5reactor.install()
     from twisted.internet import reactor
 
-    import sequencePanel.miniActor as miniActor
-
-    actor = miniActor.connectActor([])
+    if args.simulate:
+        import sequencePanel.simActor as simActor
+        actor = simActor.connectActor(reactor, script=args.script, speed=args.speed)
+    else:
+        import sequencePanel.miniActor as miniActor
+        actor = miniActor.connectActor([])
 
     try:
         ex = SequencePanel(reactor,
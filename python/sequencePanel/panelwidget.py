@@ -1,12 +1,21 @@
 __author__ = 'alefur'
 
+import logging
 import os
+from functools import partial
 
-import numpy as np
 import yaml
+from PyQt5.QtCore import QTimer
 from PyQt5.QtWidgets import QWidget, QAction, QMenuBar, QFileDialog, QVBoxLayout
 from sequencePanel.annotate import Annotate
+from sequencePanel.checkpoint import QueueJournal
+from sequencePanel.cmdqueue import CmdQueue
+from sequencePanel.dependencies import DependencyGraph
 from sequencePanel.dialog import Dialog
+from sequencePanel.engine import SchedulerEngine
+from sequencePanel.eta import DurationModel, QueueETA
+from sequencePanel.journal import Journal
+from sequencePanel.reply import Reply, ReplyPipeline
 from sequencePanel.scheduler import Scheduler
 from sequencePanel.sequence import CmdRow
 from sequencePanel.table import Table
@@ -14,6 +23,9 @@ from sequencePanel.logarea import LogLayout
 
 
 class PanelWidget(QWidget):
+    syncPeriod = 5
+    etaPeriod = 30
+
     def __init__(self, mwindow):
         self.printLevels = {'D': 0, '>': 0,
                             'I': 1, ':': 1,
@@ -21,7 +33,7 @@ class PanelWidget(QWidget):
                             'F': 3, '!': 4}
         self.printLevel = self.printLevels['I']
         self.clipboard = None
-        self.cmdRows = []
+        self.cmdRows = CmdQueue()
 
         QWidget.__init__(self)
         self.mwindow = mwindow
@@ -39,20 +51,42 @@ class PanelWidget(QWidget):
 
         self.mainLayout.addLayout(self.logLayout)
 
+        self.journal = Journal()
+        self.replies = ReplyPipeline()
+        self.replies.subscribe(self.journal.reply)
+        self.replies.subscribe(self.handleReply)
+        self.replies.subscribe(self.logLayout.logArea.printReply)
+
+        self.cmdRows.connect('rowActivated', self.activateRow)
+
         self.setMinimumWidth(920)
         self.setLayout(self.mainLayout)
 
+        self.checkpoint = QueueJournal()
+        queued = self.checkpoint.load()
+        self.restore(queued, self.journal.load(), appendMissing=not self.checkpoint.generation)
+        self.checkpoint.follow(self.cmdRows)
+
+        self.syncTimer = QTimer(self)
+        self.syncTimer.timeout.connect(self.journal.sync)
+        self.syncTimer.timeout.connect(self.checkpoint.sync)
+        self.syncTimer.start(int(PanelWidget.syncPeriod * 1000))
+
+        gap = SchedulerEngine.gap if SchedulerEngine.lowLatency else SchedulerEngine.delayCmd
+        self.eta = QueueETA(self.cmdRows, DurationModel(), gap=gap)
+        self.etaTimer = QTimer(self)
+        self.etaTimer.timeout.connect(self.updateETA)
+        self.etaTimer.start(int(PanelWidget.etaPeriod * 1000))
+        self.fitDurations()
+
     @property
     def actor(self):
         return self.mwindow.actor
 
     @property
     def currInd(self):
-        areActive = [cmdRow.isActive for cmdRow in self.cmdRows]
-        if not True in areActive:
-            return False
-        else:
-            return np.argmax(areActive) + 1
+        activeRow = self.cmdRows.first('active')
+        return False if activeRow is None else activeRow.position + 1
 
     def addSequence(self):
         return Dialog(self)
@@ -62,29 +96,86 @@ class PanelWidget(QWidget):
 
     def add(self, cmdRow):
         self.cmdRows.append(cmdRow)
-        self.updateTable()
 
     def insert(self, index, cmdRow):
-        self.cmdRows.insert(index, cmdRow)
-        self.updateTable()
-
-    def updateTable(self):
-
-        scrollvalue = self.sequenceTable.verticalScrollBar().value()
-
-        self.sequenceTable.hide()
-        self.sequenceTable.close()
-        self.sequenceTable.deleteLater()
-        self.mainLayout.removeWidget(self.sequenceTable)
-
-        self.sequenceTable = Table(self)
-        self.mainLayout.insertWidget(1, self.sequenceTable)
-
-        if scrollvalue:
-            self.sequenceTable.verticalScrollBar().setScrollValue(value=scrollvalue)
+        self.cmdRows.insert(index, [cmdRow])
+
+    def activateRow(self, cmdRow):
+        self.journal.row(cmdRow)
+        self.sendCommand(fullCmd=cmdRow.fullCmd,
+                         timeLim=7 * 24 * 3600,
+                         callFunc=partial(self.replies, cmdRow=cmdRow))
+
+    def handleReply(self, reply, cmdRow):
+        if cmdRow is not None:
+            cmdRow.handleReply(reply)
+
+    def restore(self, queued, records, appendMissing=False):
+        """ Rebuild the queue from its checkpoint, then replay journal records on top of it for the log and the
+        subcommands. Without any checkpoint yet, rows activated before the restart are appended. """
+        cmdRows = dict([(cmdRow.uid, cmdRow) for cmdRow in queued if cmdRow.uid is not None])
+        missing = []
+        logRecords = []
+
+        for record in records:
+            if record['type'] == 'row':
+                cmdRow = cmdRows.get(record['uid'])
+                if cmdRow is None:
+                    try:
+                        cmdRow = CmdRow(**record['info'], seqtype=record['seqtype'])
+                    except (TypeError, ValueError) as e:
+                        logging.warning('cannot restore row %s (%s), skipped', record['info'], e)
+                        continue
+
+                    cmdRow.uid = record['uid']
+                    cmdRows[cmdRow.uid] = cmdRow
+                    missing.append(cmdRow)
+
+            elif record['type'] == 'cmd':
+                logRecords.append((record['t'], record['actor'], 'i', (), 'cmdIn=%s' % record['text']))
+
+            elif record['type'] == 'reply':
+                try:
+                    reply = Reply.fromRecord(record)
+                except (TypeError, ValueError) as e:
+                    logging.warning('cannot restore reply %s (%s), skipped', record['text'], e)
+                    continue
+
+                logRecords.append(self.logLayout.logArea.record(reply))
+
+                if record['uid'] in cmdRows:
+                    cmdRows[record['uid']].handleReply(reply)
+
+        for cmdRow in cmdRows.values():
+            # replies are lost while the panel is down, the outcome of a running command is unknown.
+            if cmdRow.isActive:
+                cmdRow.terminate(code='F', returnStr='text="panel restarted before command completion"')
+
+        self.logLayout.logArea.load(logRecords)
+        self.cmdRows.insert(0, queued + missing if appendMissing else queued)
+
+    def fitDurations(self):
+        """ Query new sequence durations from opDB in a thread, fit them in the main thread. """
+        from sequencePanel.queries import background
+        from twisted.internet import threads
+
+        def fit(rows):
+            self.eta.model.fit(rows)
+            self.eta.remainings.clear()
+            self.updateETA()
+
+        deferred = threads.deferToThread(self.eta.model.query, background)
+        deferred.addCallbacks(fit, lambda failure: self.logLayout.logArea.newLine(
+            'text="could not fetch sequence durations : %s"' % failure.getErrorMessage(), code='w'))
+
+    def updateETA(self):
+        for cmdRow in self.eta.update():
+            cmdRow.emit('rowChanged')
+
+        self.scheduler.setETA(self.eta.end)
 
     def sendCommand(self, fullCmd, timeLim=300, callFunc=None):
-        callFunc = self.logLayout.logArea.printResponse if callFunc is None else callFunc
+        callFunc = self.replies if callFunc is None else callFunc
 
         import opscore.actor.keyvar as keyvar
 
@@ -93,7 +184,8 @@ class PanelWidget(QWidget):
         except ValueError:
             return
 
-        self.logLayout.logArea.newLine('cmdIn=%s %s' % (actor, cmdStr))
+        self.journal.cmd(actor, '%s %s' % (actor, cmdStr))
+        self.logLayout.logArea.newLine('cmdIn=%s %s' % (actor, cmdStr), actor=actor)
         self.actor.cmdr.bgCall(**dict(actor=actor,
                                       cmdStr=cmdStr,
                                       timeLim=timeLim,
@@ -127,6 +219,9 @@ class PanelWidget(QWidget):
         annotate = QAction('Annotate', self)
         annotate.triggered.connect(self.annotate)
 
+        sortDepends = QAction('Sort by dependencies', self)
+        sortDepends.triggered.connect(self.sortDepends)
+
         fileMenu.addAction(loadSequence)
         fileMenu.addAction(saveSequence)
 
@@ -135,6 +230,7 @@ class PanelWidget(QWidget):
         editMenu.addAction(selectAll)
         editMenu.addAction(clearDone)
         editMenu.addAction(annotate)
+        editMenu.addAction(sortDepends)
 
         return menubar
 
@@ -153,7 +249,11 @@ class PanelWidget(QWidget):
 
         try:
             for i, kwargs in cmdRows.items():
-                self.add(CmdRow(self, **kwargs))
+                self.add(CmdRow(**kwargs))
+
+        except ValueError as e:
+            self.mwindow.critical(f'yaml file is badly formatted : {e}')
+            return
 
         except:
             self.mwindow.critical('yaml file is badly formatted ...')
@@ -182,27 +282,31 @@ class PanelWidget(QWidget):
         self.sequenceTable.selectAll()
 
     def copy(self, cmdRows):
-        self.clipboard = [cmdRow.info for cmdRow in cmdRows]
+        self.clipboard = [cmdRow.info for cmdRow in self.cmdRows.copy(cmdRows)]
 
     def paste(self, ind):
         if self.clipboard is None:
             return
 
-        newSeq = [CmdRow(self, **kwargs) for kwargs in self.clipboard]
-        self.cmdRows[ind:ind] = newSeq
-        self.updateTable()
+        newSeq = [CmdRow(**kwargs) for kwargs in self.clipboard]
+        self.cmdRows.insert(ind, newSeq)
 
     def remove(self, cmdRows):
-        for cmdRow in cmdRows:
-            if not cmdRow in self.cmdRows:
-                continue
-
-            self.cmdRows.remove(cmdRow)
-        self.updateTable()
+        self.cmdRows.remove(cmdRows)
 
     def clearDone(self):
-        cmdRows = [cmdRow for cmdRow in self.cmdRows if cmdRow.status in ['finished', 'failed']]
-        self.remove(cmdRows)
+        self.remove(self.cmdRows.withStatus('finished') + self.cmdRows.withStatus('failed') +
+                    self.cmdRows.withStatus('cancelled'))
+
+    def sortDepends(self):
+        """ Reorder the queue so that every row comes after the rows it depends on. """
+        sortedRows, cyclic = DependencyGraph(self.cmdRows).topological()
+        if cyclic:
+            self.mwindow.critical('Dependency cycle between %s...' % ', '.join([cmdRow.label or cmdRow.name
+                                                                              for cmdRow in cyclic]))
+            return
+
+        self.cmdRows.reorder(sortedRows)
 
     def resizeEvent(self, event):
         QWidget.resizeEvent(self, event)
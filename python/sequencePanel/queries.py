@@ -0,0 +1,166 @@
+__author__ = 'alefur'
+
+import threading
+import time
+from collections import defaultdict
+
+from ics.utils.opdb import opDB
+
+
+class Statement(object):
+    """ Named SQL statement with $n placeholders, prepared once per connection and executed with its parameters.
+    Result columns are decoded with columns callables, None keeping the value as the driver returns it. """
+
+    def __init__(self, name, sql, params=(), columns=()):
+        self.name = name
+        self.sql = sql
+        self.params = params
+        self.columns = columns
+
+    @property
+    def prepare(self):
+        types = ' (%s)' % ', '.join(self.params) if self.params else ''
+        return f'PREPARE {self.name}{types} AS {self.sql}'
+
+    @property
+    def execute(self):
+        values = ' (%s)' % ', '.join(['%s'] * len(self.params)) if self.params else ''
+        return f'EXECUTE {self.name}{values}'
+
+    def decode(self, row):
+        return tuple([value if decode is None or value is None else decode(value)
+                      for decode, value in zip(self.columns, row)])
+
+
+class Queries(object):
+    """ Every opDB access of the panel, through statements prepared on a single persistent connection.
+    The connection is opened on first use, and opened again, statements prepared again, if it was lost.
+    Calls are serialized, so that queries can run from reactor threads. Each statement keeps timing counters.
+    Long queries run from reactor threads go through background, which shares the statements but has its own
+    connection and lock, so that GUI queries never wait for them.
+
+    timings : {name: [nCalls, totalTime, maxTime]}
+    """
+
+    def __init__(self, statements=None):
+        self.statements = dict() if statements is None else statements
+        self.connection = None
+        self.prepared = set()
+        self.lock = threading.Lock()
+        self.timings = defaultdict(lambda: [0, 0.0, 0.0])
+
+    def register(self, name, sql, params=(), columns=()):
+        self.statements[name] = Statement(name, sql, params=params, columns=columns)
+
+    def connect(self):
+        if self.connection is None or self.connection.closed:
+            self.connection = opDB.connect()
+            # read-only statements, each one sees the latest data without leaving a transaction open.
+            self.connection.autocommit = True
+            self.prepared = set()
+
+        return self.connection
+
+    def disconnect(self):
+        if self.connection is not None and not self.connection.closed:
+            self.connection.close()
+
+        self.connection = None
+        self.prepared = set()
+
+    def execute(self, name, params):
+        """ Run statement name with params, return decoded rows. """
+        statement = self.statements[name]
+
+        with self.lock:
+            for attempt in range(2):
+                try:
+                    with self.connect().cursor() as cursor:
+                        if name not in self.prepared:
+                            cursor.execute(statement.prepare)
+                            self.prepared.add(name)
+
+                        start = time.perf_counter()
+                        cursor.execute(statement.execute, params)
+                        rows = cursor.fetchall()
+                        break
+
+                except Exception:
+                    # an error on a live connection is the statement's own, a lost connection is retried once.
+                    if attempt or (self.connection is not None and not self.connection.closed):
+                        raise
+                    self.disconnect()
+
+            self.time(name, time.perf_counter() - start)
+
+        return [statement.decode(row) for row in rows]
+
+    def time(self, name, elapsed):
+        timing = self.timings[name]
+        timing[0] += 1
+        timing[1] += elapsed
+        timing[2] = max(timing[2], elapsed)
+
+    def fetchall(self, name, *params):
+        return self.execute(name, params)
+
+    def fetchone(self, name, *params):
+        """ Return first row, None if there is none. """
+        rows = self.execute(name, params)
+        return rows[0] if rows else None
+
+    def insert(self, table, **kwargs):
+        """ Parameterized insert, through opDB which commits it on its own connection. """
+        start = time.perf_counter()
+        opDB.insert(table, **kwargs)
+        self.time(f'insert_{table}', time.perf_counter() - start)
+
+
+queries = Queries()
+
+exposureSelect = 'select sps_exposure.pfs_visit_id, exp_type, exptime, sps_module_id, arm, ' \
+                 'sps_exposure.sps_camera_id, annotation.data_flag, annotation.notes from sps_exposure '
+# one annotation per camera exposure at most, like the former per-exposure lookup.
+exposureJoins = 'inner join sps_visit on sps_exposure.pfs_visit_id=sps_visit.pfs_visit_id ' \
+                'inner join sps_camera on sps_exposure.sps_camera_id=sps_camera.sps_camera_id ' \
+                'left join lateral (select data_flag, notes from sps_annotation ' \
+                'where sps_annotation.pfs_visit_id=sps_exposure.pfs_visit_id ' \
+                'and sps_annotation.sps_camera_id=sps_exposure.sps_camera_id limit 1) annotation on true '
+exposureOrder = 'order by sps_exposure.pfs_visit_id, sps_exposure.sps_camera_id'
+exposureColumns = (int, str, float, int, str, int, int, str)
+
+queries.register('visitsFromSet',
+                 'select pfs_visit_id from visit_set where iic_sequence_id=$1 order by pfs_visit_id',
+                 params=['integer'], columns=[int])
+
+queries.register('sequenceExposures',
+                 f'{exposureSelect}inner join visit_set on sps_exposure.pfs_visit_id=visit_set.pfs_visit_id '
+                 f'{exposureJoins}where visit_set.iic_sequence_id = any($1) {exposureOrder}',
+                 params=['integer[]'], columns=exposureColumns)
+
+queries.register('visitExposures',
+                 f'{exposureSelect}{exposureJoins}where sps_exposure.pfs_visit_id = any($1) {exposureOrder}',
+                 params=['integer[]'], columns=exposureColumns)
+
+queries.register('lastSequenceId',
+                 'select max(iic_sequence_id) from iic_sequence',
+                 columns=[int])
+
+queries.register('sequence',
+                 'select sequence_type, name, comments, cmd_str, status_flag, cmd_output from iic_sequence '
+                 'inner join iic_sequence_status on iic_sequence.iic_sequence_id=iic_sequence_status.iic_sequence_id '
+                 'where iic_sequence.iic_sequence_id=$1',
+                 params=['integer'], columns=[str, str, str, str, int, str])
+
+queries.register('finishedVisits',
+                 'select iic_sequence.iic_sequence_id, sequence_type, visit_set.pfs_visit_id, min(time_exp_start), '
+                 'max(time_exp_end), max(sps_exposure.exptime) from iic_sequence '
+                 'inner join iic_sequence_status on iic_sequence.iic_sequence_id=iic_sequence_status.iic_sequence_id '
+                 'inner join visit_set on iic_sequence.iic_sequence_id=visit_set.iic_sequence_id '
+                 'inner join sps_exposure on sps_exposure.pfs_visit_id=visit_set.pfs_visit_id '
+                 'where iic_sequence.iic_sequence_id>$1 and status_flag=0 and time_exp_start>$2 '
+                 'group by iic_sequence.iic_sequence_id, sequence_type, visit_set.pfs_visit_id '
+                 'order by iic_sequence.iic_sequence_id, min(time_exp_start)',
+                 params=['integer', 'timestamp'], columns=[int, str, int, None, None, float])
+
+background = Queries(queries.statements)
@@ -0,0 +1,54 @@
+__author__ = 'alefur'
+
+import time
+from collections import namedtuple, defaultdict
+from types import MappingProxyType
+
+
+class Reply(namedtuple('Reply', ['t', 'actor', 'code', 'keywords', 'text'])):
+    """ Reply decoded once, shared by all consumers.
+    keywords is a read-only mapping of keyword names to their values, text the canonical keywords string. """
+    __slots__ = ()
+
+    @classmethod
+    def decode(cls, resp):
+        reply = resp.replyList[-1]
+        keywords = dict([(keyword.name, tuple(keyword.values)) for keyword in reply.keywords])
+        return cls(t=time.time(), actor=reply.header.actor, code=reply.header.code,
+                   keywords=MappingProxyType(keywords), text=reply.keywords.canonical(delimiter=';'))
+
+    @classmethod
+    def fromRecord(cls, record):
+        """ Rebuild a reply from its journal record. """
+        keywords = dict([(name, tuple(values)) for name, values in record['keywords']])
+        return cls(t=record['t'], actor=record['actor'], code=record['code'], keywords=MappingProxyType(keywords),
+                   text=record['text'])
+
+    @property
+    def names(self):
+        return tuple(self.keywords)
+
+    @property
+    def isFinal(self):
+        return self.code in [':', 'F']
+
+
+class ReplyPipeline(object):
+    """ Decode each reply once and dispatch it to subscribers, as callback(reply, cmdRow).
+    cmdRow is the queued row which sent the command, None otherwise. Replies are counted per actor and code. """
+
+    def __init__(self):
+        self.subscribers = []
+        self.counts = defaultdict(int)
+
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+
+    def dispatch(self, reply, cmdRow=None):
+        self.counts[reply.actor, reply.code] += 1
+
+        for callback in self.subscribers:
+            callback(reply, cmdRow)
+
+    def __call__(self, resp, cmdRow=None):
+        self.dispatch(Reply.decode(resp), cmdRow=cmdRow)
@@ -0,0 +1,66 @@
+__author__ = 'alefur'
+
+from collections import namedtuple
+from functools import lru_cache
+
+from sequencePanel.utils import options, parseOptions
+
+arms = ['b', 'r', 'n', 'm']
+specNums = [1, 2, 3, 4]
+allCameras = frozenset([f'{arm}{specNum}' for arm in arms for specNum in specNums])
+lampNames = frozenset(['argon', 'neon', 'krypton', 'hgar', 'xenon', 'halogen'])
+sharedActors = frozenset(['iic'])
+lampFreeCommands = frozenset(['bias', 'dark', 'masterBiases', 'masterDarks', 'scienceObject', 'expose bias',
+                              'expose dark', 'expose object', 'sps abortExposure', 'sps finishExposure'])
+halogenCommands = frozenset(['flat', 'expose flat', 'ditheredFlats', 'scienceTrace'])
+
+
+def usedLamps(command, kwargs):
+    """ Lamps a command drives : lamp options, switchOn/switchOff values, halogen for flats and traces.
+    Any other command drives some lamp, all of them are assumed when none is named. """
+    lamps = frozenset(kwargs) & lampNames
+    for key in ['switchOn', 'switchOff']:
+        lamps |= frozenset(kwargs.get(key, '').split(',')) & lampNames
+
+    if command in lampFreeCommands:
+        return lamps
+    if command in halogenCommands:
+        return lamps | {'halogen'}
+
+    return lamps if lamps else lampNames
+
+
+class Resources(namedtuple('Resources', ['actor', 'cameras', 'lamps'])):
+    """ What a command holds while it runs.
+    Commands sent to a shared actor (iic) conflict only if their cameras overlap or if both drive lamps, commands
+    sent to any other actor are exclusive for that actor. """
+    __slots__ = ()
+
+    @classmethod
+    @lru_cache(maxsize=1024)
+    def fromCmdStr(cls, cmdStr):
+        actor = cmdStr.split(' ', 1)[0]
+        command = ' '.join(options.sub('', cmdStr).split()[1:])
+        kwargs = parseOptions(cmdStr)
+
+        if 'cam' in kwargs:
+            cameras = frozenset(kwargs['cam'].split(','))
+        elif 'specNum' in kwargs or 'arm' in kwargs:
+            selArms = kwargs['arm'].split(',') if 'arm' in kwargs else arms
+            selSpecs = kwargs['specNum'].split(',') if 'specNum' in kwargs else specNums
+            cameras = frozenset([f'{arm}{specNum}' for arm in selArms for specNum in selSpecs])
+        else:
+            cameras = allCameras
+
+        lamps = usedLamps(command, kwargs)
+
+        return cls(actor=actor, cameras=cameras, lamps=lamps)
+
+    def conflicts(self, other):
+        if self.actor != other.actor:
+            return False
+
+        if self.actor not in sharedActors:
+            return True
+
+        return bool(self.cameras & other.cameras) or bool(self.lamps and other.lamps)
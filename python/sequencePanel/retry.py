@@ -0,0 +1,68 @@
+__author__ = 'alefur'
+
+import os
+import re
+
+import yaml
+
+requeueModes = ['head', 'tail']
+
+
+class RetryPolicy(object):
+    """ How a failed row is retried : up to retries new attempts, the nth one starting backoff * 2**(n-1) seconds
+    after the failure, only if returnStr matches the match regexp when there is one.
+    The new attempt is queued right after the failed row (head) or at the end of the queue (tail). """
+
+    def __init__(self, retries=0, backoff=0, match='', requeue='head'):
+        if requeue not in requeueModes:
+            raise ValueError(f'requeue must be one of {requeueModes}, not {requeue}')
+
+        self.retries = int(retries)
+        self.backoff = float(backoff)
+        self.match = match
+        self.requeue = requeue
+        self.pattern = re.compile(match) if match else None
+
+    @property
+    def info(self):
+        return dict(retries=self.retries, backoff=self.backoff, match=self.match, requeue=self.requeue)
+
+    def applies(self, cmdRow):
+        """ True if cmdRow failed the way this policy covers and attempts are left. """
+        if cmdRow.status != 'failed' or cmdRow.attempt >= self.retries:
+            return False
+
+        return self.pattern is None or self.pattern.search(cmdRow.returnStr) is not None
+
+    def delay(self, attempt):
+        """ Delay before attempt number attempt + 1. """
+        return self.backoff * 2 ** attempt
+
+
+class RetryPolicies(object):
+    """ Retry policy of each row, its own if it has one, the one of its sequence type otherwise.
+    Sequence types are the iic sequence type (eg biases) or the iic command (eg bias), no retry by default. """
+    path = os.path.expanduser('~/.sequencePanel/retry.yaml')
+
+    def __init__(self, bySeqtype=None):
+        self.bySeqtype = dict() if bySeqtype is None else bySeqtype
+
+    @classmethod
+    def load(cls, path=None):
+        """ Read {seqtype: {retries, backoff, match, requeue}} from a yaml file, no policy if there is none. """
+        path = RetryPolicies.path if path is None else os.path.expandvars(path)
+        if not os.path.exists(path):
+            return cls()
+
+        with open(path, 'r') as cfgFile:
+            config = yaml.load(cfgFile, Loader=yaml.FullLoader) or dict()
+
+        return cls(dict([(seqtype, RetryPolicy(**kwargs)) for seqtype, kwargs in config.items()]))
+
+    def policy(self, cmdRow):
+        if cmdRow.retry is not None:
+            return cmdRow.retry
+
+        for seqtype in [cmdRow.seqtype, ''.join(cmdRow.cmdStr.split()[1:2])]:
+            if seqtype in self.bySeqtype:
+                return self.bySeqtype[seqtype]
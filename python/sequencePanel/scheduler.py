@@ -1,11 +1,12 @@
 __author__ = 'alefur'
 
-from datetime import datetime as dt
-from datetime import timedelta
+import time
+from datetime import datetime as dt, timezone
 
-from PyQt5.QtCore import QTimer
 from PyQt5.QtWidgets import QGridLayout, QSpinBox, QProgressBar, QMessageBox
-from sequencePanel.widgets import CLabel, Label, PushButton
+from sequencePanel.engine import SchedulerEngine
+from sequencePanel.sequence import startTime
+from sequencePanel.widgets import CLabel, Label, PushButton, LineEdit
 
 
 class SafetyCheck(QMessageBox):
@@ -78,52 +79,48 @@ class FinishNowButton(PushButton):
 
 
 class DelayBar(QProgressBar):
+    """ Progress towards start time, updated by the scheduler timers each time one more percent is reached. """
+
     def __init__(self, scheduler):
         self.scheduler = scheduler
         QProgressBar.__init__(self)
         self.setStyleSheet("QProgressBar { font: 8pt;}")
         self.setFixedSize(160, 28)
+        self.setRange(0, 100)
 
         self.setVisible(False)
-        self.progressing = QTimer(scheduler)
-        self.progressing.setInterval(500)
-        self.progressing.timeout.connect(self.wait)
+        self.tick = None
 
-    @property
-    def delta(self):
-        return int((dt.now() - self.tstart).total_seconds())
-
-    def start(self, delay):
-        self.delay = delay
-        self.tstart = dt.now()
-        self.setValue(0)
-        self.setRange(0, delay)
-        self.setFormat("Start : %s \r\n " % self.startDate(delay) + '%p%')
+    def start(self, tend):
+        self.scheduler.timers.cancel(self.tick)
+        self.tstart, self.tend = time.time(), tend
+        self.setFormat("Start : %s \r\n " % self.startDate(tend) + '%p%')
         self.setVisible(True)
-        self.progressing.start()
+        self.progress(0)
+
+    def startDate(self, tend):
+        return '%s UTC' % dt.fromtimestamp(tend, timezone.utc).strftime('%Y-%m-%d %H:%M')
 
-    def startDate(self, delay):
-        return (dt.now() + timedelta(seconds=delay)).isoformat()[: -10]
+    def progress(self, percent):
+        self.setValue(percent)
+        if percent < 100:
+            tnext = self.tstart + (self.tend - self.tstart) * (percent + 1) / 100
+            self.tick = self.scheduler.timers.schedule(tnext, lambda: self.progress(percent + 1))
 
     def stop(self):
-        self.progressing.stop()
+        self.scheduler.timers.cancel(self.tick)
+        self.tick = None
         self.hide()
 
-    def wait(self):
-        if self.delta < self.delay:
-            self.setValue(self.delta)
-        else:
-            self.stop()
-            self.scheduler.activate()
-
 
 class Scheduler(QGridLayout):
-    delayCmd = 2
+    """ Scheduler controls, the execution itself is done by SchedulerEngine which this layout observes. """
 
     def __init__(self, panelwidget):
         self.panelwidget = panelwidget
         QGridLayout.__init__(self)
-        self.doAbort = False
+        self.engine = SchedulerEngine(panelwidget.cmdRows, panelwidget.mwindow.reactor, panelwidget.sendCommand)
+        self.timers = self.engine.timers
         self.stateWidget = CLabel('OFF')
         self.startButton = PushButton("START")
         self.stopButton = PushButton("STOP")
@@ -136,6 +133,9 @@ class Scheduler(QGridLayout):
         self.delay = QSpinBox()
         self.delay.setValue(0)
         self.delay.setRange(0, 24 * 60 * 10)
+        self.startAt = LineEdit()
+        self.startAt.setPlaceholderText('HH:MM')
+        self.etaLabel = Label('ETA : -')
 
         self.startButton.clicked.connect(self.start)
         self.stopButton.clicked.connect(self.stop)
@@ -144,9 +144,12 @@ class Scheduler(QGridLayout):
         self.abortButton.clicked.connect(self.abort)
 
         self.addWidget(Label("Delay (min)"), 0, 1)
+        self.addWidget(Label("Start (UTC)"), 0, 6)
         self.addWidget(self.stateWidget, 1, 0)
         self.addWidget(self.delay, 1, 1)
+        self.addWidget(self.startAt, 1, 6)
         self.addWidget(self.delayBar, 0, 2, 1, 2)
+        self.addWidget(self.etaLabel, 0, 4, 1, 2)
 
         self.addWidget(self.startButton, 1, 2)
         self.addWidget(self.stopButton, 1, 2)
@@ -154,75 +157,81 @@ class Scheduler(QGridLayout):
         self.addWidget(self.finishNowButton, 1, 4)
         self.addWidget(self.abortButton, 1, 5)
 
-        self.setState('off')
+        self.engine.connect('stateChanged', self.setState)
+        self.engine.connect('waiting', lambda tstart: self.delayBar.start(tend=tstart))
+        self.engine.connect('dispatched', lambda cmdRows: self.delayBar.stop())
+        self.engine.connect('deadTime', self.reportDeadTime)
+        self.engine.connect('retried', self.reportRetry)
 
-    @property
-    def validated(self):
-        return [cmdRow for cmdRow in self.panelwidget.cmdRows if cmdRow.isValid]
+        self.setState('off')
 
     @property
     def activated(self):
-        return [cmdRow for cmdRow in self.panelwidget.cmdRows if cmdRow.isActive]
+        return self.engine.activated
 
     def setState(self, state):
-        self.state = state
         self.stateWidget.setText(state.upper())
 
-        self.startButton.setVisible(self.state == 'off')
-        self.stopButton.setVisible(self.state in ['waiting', 'processing'])
+        self.startButton.setVisible(state == 'off')
+        self.stopButton.setVisible(state in ['waiting', 'processing'])
+
+        isActive = self.activated is not None
+        self.finishButton.setVisible(isActive)
+        self.finishNowButton.setVisible(isActive)
+        self.abortButton.setVisible(isActive)
+
+        if state == 'off':
+            self.delayBar.stop()
 
-        self.finishButton.setVisible(bool(len(self.activated)))
-        self.finishNowButton.setVisible(bool(len(self.activated)))
-        self.abortButton.setVisible(bool(len(self.activated)))
+    def setETA(self, end):
+        self.etaLabel.setText('ETA : -' if end is None else
+                              'ETA : %s UTC' % dt.fromtimestamp(end, timezone.utc).strftime('%H:%M'))
+
+    def reportDeadTime(self, night, deadTime, stats):
+        nSequences, total, longest = stats
+        self.panelwidget.logLayout.logArea.newLine('deadTime=%.3f night=%s nSequences=%d total=%.1f max=%.3f' %
+                                                   (deadTime, night, nSequences, total, longest),
+                                                   actor='sequencePanel')
+
+    def reportRetry(self, cmdRow, retryRow):
+        self.panelwidget.logLayout.logArea.newLine('retry="%s" attempt=%d startAt="%s"' %
+                                                   (retryRow.name, retryRow.attempt,
+                                                    self.delayBar.startDate(retryRow.startAt)),
+                                                   code='w', actor='sequencePanel')
 
     def start(self):
         if self.activated:
-            self.activate()
+            self.engine.start()
             return
 
-        if not len(self.validated):
-            self.panelwidget.mwindow.critical('No valid sequence has been scheduled...')
+        error = self.engine.check()
+        if error is not None:
+            self.panelwidget.mwindow.critical(error)
             return
 
-        delay = self.delay.value() * 60
-        delay = Scheduler.delayCmd if not delay else delay
-
-        msgBox = StartMessage(self.delayBar.startDate(delay), parent=self.panelwidget)
-
-        if msgBox.exec() != QMessageBox.Ok:
+        try:
+            tstart = startTime(self.startAt.text()) if self.startAt.text().strip() else None
+        except ValueError:
+            self.panelwidget.mwindow.critical('Start time should be HH:MM[:SS] or YYYY-MM-DDTHH:MM UTC...')
             return
 
-        self.nextSVP(delay=delay)
+        if tstart is None:
+            delay = self.delay.value() * 60
+            tstart = time.time() + (SchedulerEngine.delayCmd if not delay else delay)
 
-    def activate(self):
-        if self.activated:
-            self.setState('processing')
-            return
+        msgBox = StartMessage(self.delayBar.startDate(tstart), parent=self.panelwidget)
 
-        try:
-            self.validated[0].setActive()
-            self.setState('processing')
-        except IndexError:
-            self.stop(safetyCheck=False)
-
-    def nextSVP(self, delay=None):
-        if not len(self.validated) or self.doAbort:
-            self.stop(safetyCheck=False)
-            self.doAbort = False
+        if msgBox.exec() != QMessageBox.Ok:
             return
 
-        delay = Scheduler.delayCmd if delay is None else delay
-        self.setState('waiting')
-        self.delayBar.start(delay=delay)
+        self.engine.start(tstart)
 
-    def stop(self, safetyCheck=True):
-        if safetyCheck:
-            msgBox = StopMessage(parent=self.panelwidget)
-            if msgBox.exec() != QMessageBox.Ok:
-                return
+    def stop(self):
+        msgBox = StopMessage(parent=self.panelwidget)
+        if msgBox.exec() != QMessageBox.Ok:
+            return
 
-        self.setState('off')
-        self.delayBar.stop()
+        self.engine.stop()
 
     def abort(self):
         if not self.activated:
@@ -233,8 +242,7 @@ class Scheduler(QGridLayout):
         if msgBox.exec() != QMessageBox.Ok:
             return
 
-        self.panelwidget.sendCommand(fullCmd='iic sps abortExposure', timeLim=10)
-        self.doAbort = True
+        self.engine.abort()
 
     def finish(self):
         if not self.activated:
@@ -245,8 +253,7 @@ class Scheduler(QGridLayout):
         if msgBox.exec() != QMessageBox.Ok:
             return
 
-        self.panelwidget.sendCommand(fullCmd='iic sps finishExposure', timeLim=10)
-        self.doAbort = True
+        self.engine.finish()
 
     def finishNow(self):
         if not self.activated:
@@ -257,5 +264,4 @@ class Scheduler(QGridLayout):
         if msgBox.exec() != QMessageBox.Ok:
             return
 
-        self.panelwidget.sendCommand(fullCmd='iic sps finishExposure now', timeLim=10)
-        self.doAbort = True
+        self.engine.finishNow()
@@ -1,29 +1,71 @@
 __author__ = 'alefur'
 
-from functools import partial
+import time
+from bisect import bisect_left, insort
+from datetime import date, datetime, timedelta, timezone
 
-import numpy as np
-from PyQt5.QtWidgets import QCheckBox
-from sequencePanel.widgets import IconButton, EyeButton
+from sequencePanel.decoders import registry
+from sequencePanel.dependencies import parseDepends, formatDepends
+from sequencePanel.retry import RetryPolicy
+
+statusNames = ['init', 'valid', 'active', 'finished', 'failed', 'cancelled']
+statusCodes = dict([(name, code) for code, name in enumerate(statusNames)])
+
+
+minEpoch = 1e9
+
+
+def startTime(value):
+    """ Return start time as a timestamp, value is a timestamp, a datetime, an ISO date or HH:MM[:SS] for the next
+    occurrence, all in UTC. Small numbers are what yaml makes of an unquoted HH:MM, they are rejected. """
+    if value is None:
+        return value
+
+    if isinstance(value, (int, float)):
+        if value < minEpoch:
+            raise ValueError(f'startAt={value} is not a timestamp, HH:MM[:SS] must be quoted in yaml scripts')
+        return value
+
+    if isinstance(value, date):
+        value = value if isinstance(value, datetime) else datetime.combine(value, datetime.min.time())
+        return (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).timestamp()
+
+    value = value.strip()
+    if 'T' in value or '-' in value:
+        return startTime(datetime.fromisoformat(value))
+
+    now = datetime.now(timezone.utc)
+    fields = [int(field) for field in value.split(':')]
+    hour, minute, second = (fields + [0, 0])[:3]
+    start = now.replace(hour=hour, minute=minute, second=second, microsecond=0)
+
+    return (start if start > now else start + timedelta(days=1)).timestamp()
 
 
 class SubCommand(object):
-    def __init__(self, subId, cmdStr, didFail, returnStr):
-        self.id = subId
-        self.cmdStr = cmdStr
+    __slots__ = ('id', 'cmdStr', 'anomalies', 'returnStr', 'visit', 'cameraMask', 'statusCode')
+
+    def __init__(self, info):
+        self.id = info.id
+        self.cmdStr = info.cmdStr
         self.anomalies = ''
-        self.returnStr = returnStr
+        self.returnStr = info.returnStr
+        self.visit = info.visit
+        self.cameraMask = info.cameraMask
 
-        self.visit = self.decode(returnStr)
-        self.setStatus(int(didFail))
+        self.setStatus(info.didFail)
+
+    @property
+    def status(self):
+        return statusNames[self.statusCode]
 
     @property
     def isActive(self):
-        return self.status == 'active'
+        return self.statusCode == statusCodes['active']
 
     @property
     def isValid(self):
-        return self.status == 'valid'
+        return self.statusCode == statusCodes['valid']
 
     @property
     def visitStart(self):
@@ -34,60 +76,56 @@ class SubCommand(object):
         return self.visit
 
     def setActive(self):
-        self.status = 'active'
+        self.statusCode = statusCodes['active']
 
     def setStatus(self, didFail):
         if didFail == -1:
-            self.status = 'valid'
+            self.statusCode = statusCodes['valid']
         elif didFail == 0:
-            self.status = 'finished'
+            self.statusCode = statusCodes['finished']
         elif didFail == 1:
-            self.status = 'failed'
+            self.statusCode = statusCodes['failed']
         elif didFail == 2:
-            self.status = 'cancelled'
+            self.statusCode = statusCodes['cancelled']
         else:
             raise ValueError(f'unknown status: {didFail}')
 
-    def decode(self, returnStr):
-        try:
-            __, keys = returnStr.split('fileids=')
-            visit, __, mask = keys.split(',')
-        except ValueError:
-            return -1
-
-        return int(visit)
-
 
 class CmdRow(object):
-    color = {"init": ("#FF7D7D", "#000000"), "valid": ("#7DFF7D", "#000000"), "active": ("#4A90D9", "#FFFFFF"),
-             "finished": ("#5f9d63", "#FFFFFF"), "failed": ("#9d5f5f", "#FFFFFF")}
-
-    def __init__(self, panelwidget, name, comments, cmdStr, seqtype=''):
-        self.status = 'init'
+    """ Queued sequence, Qt-free.
+    The owning CmdQueue is notified of every change, the GUI only observes the queue.
+    Subcommands are kept sorted by id, with per-status sorted ids and visit range maintained as they arrive. """
+    __slots__ = ('queue', 'position', 'uid', 'statusCode', 'id', 'seqtype', 'name', 'comments', 'cmdStr', 'cmds',
+                 'subIds', 'subcommands', 'subIndex', 'visitStart', 'visitEnd', 'returnStr', 'dbname', 'showSub',
+                 'expandable', 'startAt', 'label', 'depends', 'eta', 'retry', 'attempt')
+
+    def __init__(self, name, comments, cmdStr, seqtype='', startAt=None, label='', after='', ifFailed='',
+                 retry=None, attempt=0):
+        self.queue = None
+        self.position = None
+        self.uid = None
+        self.statusCode = statusCodes['init']
         self.id = -1
-        self.panelwidget = panelwidget
         self.seqtype = seqtype
         self.name = name
         self.comments = comments
         self.cmdStr = cmdStr
         self.cmds = dict()
+        self.subIds = []
+        self.subcommands = []
+        self.subIndex = [[] for status in statusNames]
+        self.visitStart = -1
+        self.visitEnd = -1
         self.returnStr = ''
-
-        self.valid = QCheckBox()
-        self.valid.stateChanged.connect(self.setValid)
-        self.colorCheckbox()
-
-        self.buttonMoveUp = IconButton(iconFile='arrow_up2.png')
-        self.buttonMoveUp.clicked.connect(self.moveUp)
-
-        self.buttonMoveDown = IconButton(iconFile='arrow_down2.png')
-        self.buttonMoveDown.clicked.connect(self.moveDown)
-
-        self.buttonDelete = IconButton(iconFile='delete.png')
-        self.buttonDelete.clicked.connect(self.remove)
-
-        self.buttonEye = EyeButton()
-        self.buttonEye.clicked.connect(partial(self.showSubcommands))
+        self.dbname = ''
+        self.showSub = False
+        self.expandable = False
+        self.startAt = startTime(startAt)
+        self.label = label
+        self.depends = parseDepends(after) + [(label, 'failed') for label, __ in parseDepends(ifFailed)]
+        self.eta = None
+        self.retry = None if retry is None else RetryPolicy(**retry)
+        self.attempt = attempt
 
     @property
     def fullCmd(self):
@@ -97,195 +135,217 @@ class CmdRow(object):
 
     @property
     def info(self):
-        return dict(name=self.name, comments=self.comments, cmdStr=self.cmdStr)
+        info = dict(name=self.name, comments=self.comments, cmdStr=self.cmdStr)
+        if self.startAt is not None:
+            info['startAt'] = self.startAt
+        if self.label:
+            info['label'] = self.label
+        if self.depends:
+            info['after'] = self.dependsStr
+        if self.retry is not None:
+            info['retry'] = self.retry.info
+        if self.attempt:
+            info['attempt'] = self.attempt
+
+        return info
 
     @property
-    def subcommands(self):
-        return [self.cmds[k] for k in sorted(self.cmds.keys())]
+    def attemptStr(self):
+        return str(self.attempt) if self.attempt else ''
 
     @property
-    def isValid(self):
-        return self.status == 'valid'
+    def etaStr(self):
+        return '' if self.eta is None else datetime.fromtimestamp(self.eta, timezone.utc).strftime('%H:%M')
 
     @property
-    def isActive(self):
-        return self.status == 'active'
+    def dependsStr(self):
+        return formatDepends(self.depends)
+
+    @dependsStr.setter
+    def dependsStr(self, text):
+        self.depends = parseDepends(text)
 
     @property
-    def showSub(self):
-        return self.buttonEye.state
+    def isDue(self):
+        """ True if the row has no start time or if it is reached. """
+        return self.startAt is None or self.startAt <= time.time()
 
     @property
-    def nbRows(self):
-        nbRows = len(self.subcommands) if (self.showSub and self.subcommands) else 2
-        nbRows = 2 if nbRows < 2 else nbRows
-        return nbRows
+    def status(self):
+        return statusNames[self.statusCode]
 
     @property
-    def height(self):
-        isActive = [subcommand.isActive for subcommand in self.subcommands]
-        height = (np.argmax(isActive) + 0.5) if (self.showSub and isActive) else 1
-        return height
+    def isValid(self):
+        return self.statusCode == statusCodes['valid']
 
     @property
-    def visits(self):
-        return [subcommand.visit for subcommand in self.subcommands if subcommand.visit != -1]
+    def isActive(self):
+        return self.statusCode == statusCodes['active']
 
     @property
-    def visitStart(self):
-        if not self.visits:
-            return -1
-        return min(self.visits)
+    def nbRows(self):
+        return len(self.subcommands) if (self.showSub and self.subcommands) else 1
 
     @property
-    def visitEnd(self):
-        if not self.visits:
-            return -1
-        return max(self.visits)
+    def height(self):
+        if not (self.showSub and self.subcommands):
+            return 1
+
+        activeIds = self.subIndex[statusCodes['active']]
+        return (bisect_left(self.subIds, activeIds[0]) if activeIds else 0) + 0.5
+
+    @property
+    def visits(self):
+        return [subcommand.visit for subcommand in self.subcommands if subcommand.visit != -1]
 
     @property
     def registered(self):
-        return self.status in ['finished', 'failed'] and self.visits
+        return self.status in ['finished', 'failed'] and self.visitStart != -1
 
-    def colorCheckbox(self):
-        self.valid.setStyleSheet("QCheckBox {background-color:%s};" % CmdRow.color[self.status][0])
+    @property
+    def state(self):
+        """ What the queue checkpoint keeps of the row, subcommands are rebuilt from the reply journal. """
+        return dict(info=self.info, seqtype=self.seqtype, status=self.status, uid=self.uid, id=self.id,
+                    dbname=self.dbname, returnStr=self.returnStr, visitStart=self.visitStart, visitEnd=self.visitEnd)
+
+    @classmethod
+    def fromState(cls, state):
+        """ Rebuild a row from its checkpoint state, before it is inserted in a queue. """
+        cmdRow = cls(**state['info'], seqtype=state['seqtype'])
+        cmdRow.statusCode = statusCodes[state['status']]
+        cmdRow.expandable = state['id'] != -1
+        for attr in ['uid', 'id', 'dbname', 'returnStr', 'visitStart', 'visitEnd']:
+            setattr(cmdRow, attr, state[attr])
+
+        return cmdRow
+
+    def copy(self):
+        """ Copy without label nor dependencies, which refer to this very row. """
+        return CmdRow(self.name, self.comments, self.cmdStr, seqtype=self.seqtype, startAt=self.startAt,
+                      retry=None if self.retry is None else self.retry.info)
+
+    def retryCopy(self, startAt=None):
+        """ Next attempt of this row, which takes over its label and dependencies. """
+        cmdRow = CmdRow(self.name, self.comments, self.cmdStr, seqtype=self.seqtype, startAt=startAt, label=self.label,
+                        retry=None if self.retry is None else self.retry.info, attempt=self.attempt + 1)
+        cmdRow.depends = list(self.depends)
+        return cmdRow
+
+    def emit(self, event):
+        if self.queue is not None:
+            self.queue.emit(event, self)
 
     def setStatus(self, status):
-        self.status = status
-        self.colorCheckbox()
+        previous, self.statusCode = self.statusCode, statusCodes[status]
+        if self.queue is not None:
+            self.queue.updateStatus(self, previous)
 
-        self.panelwidget.updateTable()
+        self.emit('rowChanged')
 
     def setActive(self):
         self.setStatus(status='active')
-        self.valid.setEnabled(False)
 
-        self.panelwidget.sendCommand(fullCmd=self.fullCmd,
-                                     timeLim=7 * 24 * 3600,
-                                     callFunc=self.handleResult)
+        self.emit('rowActivated')
 
     def setFinished(self):
-        self.valid.setEnabled(False)
         self.setStatus(status='finished')
 
     def setFailed(self):
-        self.valid.setEnabled(False)
         self.setStatus(status='failed')
 
-    def setValid(self, state):
-        status = "valid" if state == 2 else "init"
+    def setValid(self, valid=True):
+        status = "valid" if valid else "init"
         self.setStatus(status=status)
 
-    def showSubcommands(self, *args, bool=None):
-        state = not self.buttonEye.state if bool is None else bool
-
-        self.buttonEye.setState(state=state)
-        self.panelwidget.updateTable()
+    def toggleValid(self):
+        self.setValid(valid=not self.isValid)
 
-    def handleResult(self, resp):
-        reply = resp.replyList[-1]
-        returnStr = reply.keywords.canonical(delimiter=';')
-        code = resp.lastCode
+    def showSubcommands(self, *args, bool=None):
+        self.showSub = not self.showSub if bool is None else bool
+        self.emit('rowChanged')
 
-        if code in [':', 'F']:
-            self.terminate(code=code, returnStr=returnStr)
+    def handleReply(self, reply):
+        """ Update from a reply to the command this row sent. """
+        if reply.isFinal:
+            self.terminate(code=reply.code, returnStr=reply.text)
         else:
-            self.updateInfo(reply=reply)
-
-        self.panelwidget.logLayout.logArea.printResponse(resp=resp)
-
-    def updateInfo(self, reply):
-
-        if 'sps_sequence' in reply.keywords:
-            self.setSPSSequence(*reply.keywords['sps_sequence'].values)
-
-        elif 'sequence' in reply.keywords:
-            self.setSequence(*reply.keywords['sequence'].values)
+            self.updateInfo(keywords=reply.keywords)
 
-        elif 'experiment' in reply.keywords:
-            self.setExperiment(*reply.keywords['experiment'].values)
-
-        elif 'subCommand' in reply.keywords:
-            self.updateSubCommand(*reply.keywords['subCommand'].values)
+    def updateInfo(self, keywords):
+        """ Apply keywords which have a registered decoder. """
+        for name, values in keywords.items():
+            decoded = registry.decode(name, values)
+            if decoded is not None:
+                handler, info = decoded
+                getattr(self, handler)(info)
 
     def terminate(self, code, returnStr):
         self.returnStr = returnStr
         self.setFinished() if code == ':' else self.setFailed()
 
-        self.panelwidget.scheduler.nextSVP()
+        self.emit('rowTerminated')
 
-    def setSPSSequence(self, sequenceId, seqtype, cmdStr, name, comments, status, *args):
+    def setSequenceInfo(self, info):
+        self.id = info.id
+        self.seqtype = info.seqtype
+        self.name = info.name
+        self.comments = info.comments
+        self.cmdStr = info.cmdStr
+        self.dbname = info.dbname
+        self.expandable = True
 
-        self.id = int(sequenceId)
-        self.seqtype = seqtype
-        self.name = name
-        self.comments = comments
-        self.cmdStr = cmdStr
-        self.buttonEye.setEnabled(True)
+        self.emit('rowChanged')
 
-        self.panelwidget.updateTable()
+    def updateSubCommand(self, info):
+        self.setSubCommand(SubCommand(info))
 
-    def setSequence(self, sequenceId, groupId, seqtype, name, comments, cmdStr, status, output, *args):
+        validIds = self.subIndex[statusCodes['valid']]
+        activeIds = self.subIndex[statusCodes['active']]
 
-        self.id = int(sequenceId)
-        self.seqtype = seqtype
-        self.name = name
-        self.comments = comments
-        self.cmdStr = cmdStr
-        self.buttonEye.setEnabled(True)
+        if validIds and not activeIds:
+            subcommand = self.cmds[validIds[0]]
+            self.unindexSubCommand(subcommand)
+            subcommand.setActive()
+            insort(self.subIndex[subcommand.statusCode], subcommand.id)
 
-        self.panelwidget.updateTable()
+        self.emit('rowChanged')
 
-    def setExperiment(self, dbname, experimentId, seqtype, cmdStr, name, comments):
+    def setSubCommand(self, subcommand):
+        """ Add or replace a subcommand, keeping sorted order, status index and visit range up to date. """
+        previous = self.cmds.get(subcommand.id)
+        pos = bisect_left(self.subIds, subcommand.id)
 
-        self.dbname = dbname
-        self.id = int(experimentId)
-        self.seqtype = seqtype
-        self.name = name
-        self.comments = comments
-        self.cmdStr = cmdStr
-        self.buttonEye.setEnabled(True)
-
-        self.panelwidget.updateTable()
-
-    def updateSubCommand(self, expId, subId, *args):
-        subId = int(subId)
-        self.cmds[subId] = SubCommand(subId, *args)
+        if previous is None:
+            self.subIds.insert(pos, subcommand.id)
+            self.subcommands.insert(pos, subcommand)
+        else:
+            self.unindexSubCommand(previous)
+            self.subcommands[pos] = subcommand
 
-        actives = [subcommand for subcommand in self.subcommands if subcommand.isActive]
-        valids = [subcommand for subcommand in self.subcommands if subcommand.isValid]
+        self.cmds[subcommand.id] = subcommand
+        insort(self.subIndex[subcommand.statusCode], subcommand.id)
 
-        if actives:
-            return
+        if previous is not None and previous.visit not in [-1, subcommand.visit]:
+            visits = self.visits
+            self.visitStart = min(visits) if visits else -1
+            self.visitEnd = max(visits) if visits else -1
 
-        if valids:
-            valids[0].setActive()
+        elif subcommand.visit != -1:
+            self.visitStart = subcommand.visit if self.visitStart == -1 else min(self.visitStart, subcommand.visit)
+            self.visitEnd = max(self.visitEnd, subcommand.visit)
 
-        self.panelwidget.updateTable()
+    def unindexSubCommand(self, subcommand):
+        subIds = self.subIndex[subcommand.statusCode]
+        del subIds[bisect_left(subIds, subcommand.id)]
 
     def moveUp(self):
-        cmdRows = self.panelwidget.cmdRows
-
-        new_ind = cmdRows.index(self) - 1
-        new_ind = 0 if new_ind < 0 else new_ind
-        cmdRows.remove(self)
-        cmdRows.insert(new_ind, self)
-
-        self.panelwidget.updateTable()
+        if self.queue is not None:
+            self.queue.move(self, max(self.position - 1, 0))
 
     def moveDown(self):
-        cmdRows = self.panelwidget.cmdRows
-
-        new_ind = cmdRows.index(self) + 1
-        new_ind = len(cmdRows) - 1 if new_ind > len(cmdRows) - 1 else new_ind
-        cmdRows.remove(self)
-        cmdRows.insert(new_ind, self)
-
-        self.panelwidget.updateTable()
+        if self.queue is not None:
+            self.queue.move(self, min(self.position + 1, len(self.queue) - 1))
 
     def remove(self):
-        if not self.isActive:
-            cmdRows = self.panelwidget.cmdRows
-            cmdRows.remove(self)
-
-            self.panelwidget.updateTable()
+        if not self.isActive and self.queue is not None:
+            self.queue.remove([self])
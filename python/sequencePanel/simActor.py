@@ -0,0 +1,156 @@
+__author__ = 'alefur'
+
+from collections import defaultdict, namedtuple
+from itertools import count, cycle
+
+from sequencePanel.journal import isRecord, readRecords
+from sequencePanel.resources import allCameras
+from sequencePanel.utils import parseOptions
+
+Header = namedtuple('Header', ['actor', 'code'])
+Keyword = namedtuple('Keyword', ['name', 'values'])
+Reply = namedtuple('Reply', ['header', 'keywords'])
+Response = namedtuple('Response', ['replyList', 'lastCode', 'didFail'])
+
+readoutTime = 60
+
+
+class Keywords(list):
+    """ Keywords of a simulated reply, formatted the way opscore does. """
+
+    def canonical(self, delimiter=';'):
+        return delimiter.join([f'{keyword.name}=' + ','.join([str(value) for value in keyword.values])
+                               for keyword in self])
+
+
+def reply(actor, code, **keywords):
+    return Response(replyList=[Reply(Header(actor, code), Keywords([Keyword(name, values) for name, values in
+                                                                    keywords.items()]))],
+                    lastCode=code, didFail=code == 'F')
+
+
+class SyntheticScript(object):
+    """ Reply stream of an iic sequence built from its cmdStr : one subCommand per exposure, exptime plus readout
+    apart, each closing with its fileids. Yield (delay, response) pairs. """
+    sequenceIds = count(1)
+    visits = count(100000)
+
+    def __call__(self, actor, cmdStr):
+        kwargs = parseOptions(cmdStr)
+        seqtype = cmdStr.split(' ', 1)[0]
+        sequenceId = next(self.sequenceIds)
+        duplicate = int(kwargs.get('duplicate', 1))
+        exptime = float(kwargs.get('exptime', '0').split(',')[0])
+        cameraMask = hex(sum([1 << i for i, cam in enumerate(sorted(allCameras))]))
+
+        yield 0, reply(actor, 'i', sps_sequence=(sequenceId, seqtype, f'{actor} {cmdStr}', kwargs.get('name', ''),
+                                                 kwargs.get('comments', ''), 'active'))
+
+        for subId in range(duplicate):
+            subCmd = f'sps expose {seqtype} exptime={exptime}'
+            yield 0, reply(actor, 'i', subCommand=(sequenceId, subId, subCmd, -1, ''))
+            yield exptime + readoutTime, reply(actor, 'i', subCommand=(sequenceId, subId, subCmd, 0,
+                                                                       f'fileids={next(self.visits)},0,{cameraMask}'))
+
+        yield 0, reply(actor, ':', sps_sequence=(sequenceId, seqtype, f'{actor} {cmdStr}', kwargs.get('name', ''),
+                                                 kwargs.get('comments', ''), 'complete'))
+
+
+class RecordedScript(object):
+    """ Reply streams of the rows recorded in a journal segment, replayed with their original timing.
+    A command gets the recording of the same cmdStr if there is one, the next recording otherwise.
+    The segment is read like the panel journal, damaged and incomplete records are skipped, it is left untouched. """
+
+    def __init__(self, path):
+        streams = defaultdict(list)
+        self.cmdStrs = dict()
+
+        for record in filter(isRecord, readRecords(path, truncate=False)):
+            if record['type'] == 'row' and 'cmdStr' in record['info']:
+                self.cmdStrs[record['uid']] = record['info']['cmdStr']
+            elif record['type'] == 'reply' and record['uid'] is not None:
+                streams[record['uid']].append(record)
+
+        if not streams:
+            raise ValueError(f'{path} holds no reply to a queued row, nothing to replay')
+
+        self.byCmdStr = dict([(self.cmdStrs[uid], stream) for uid, stream in streams.items() if uid in self.cmdStrs])
+        self.streams = cycle(list(streams.values()))
+
+    def __call__(self, actor, cmdStr):
+        stream = self.byCmdStr.get(f'{actor} {cmdStr}')
+        stream = next(self.streams) if stream is None else stream
+        t0 = stream[0]['t']
+
+        for record in stream:
+            keywords = dict([(name, tuple(values)) for name, values in record['keywords']])
+            yield record['t'] - t0, reply(record['actor'], record['code'], **keywords)
+            t0 = record['t']
+
+
+class SimCmdr(object):
+    """ Stand-in for actor.cmdr, iic sequences are answered by a script, time runs speed times faster.
+    abortExposure fails the running sequences, finishExposure completes them. """
+
+    def __init__(self, reactor, script, speed=1.0):
+        self.reactor = reactor
+        self.script = script
+        self.speed = speed
+        self.running = dict()
+        self.ids = count()
+
+    def bgCall(self, actor, cmdStr, timeLim=None, callFunc=None, callCodes=None):
+        if actor != 'iic' or cmdStr.startswith('sps '):
+            self.control(actor, cmdStr, callFunc)
+            return
+
+        cmdId = next(self.ids)
+        self.running[cmdId] = callFunc
+        self.step(cmdId, self.script(actor, cmdStr), callFunc)
+
+    def step(self, cmdId, stream, callFunc):
+        """ Deliver the next reply of the stream after its delay. """
+        if cmdId not in self.running:
+            stream.close()
+            return
+
+        try:
+            delay, response = next(stream)
+        except StopIteration:
+            self.running.pop(cmdId, None)
+            return
+
+        def deliver():
+            if cmdId not in self.running:
+                return
+            if response.lastCode in [':', 'F']:
+                self.running.pop(cmdId, None)
+            callFunc(response)
+            self.step(cmdId, stream, callFunc)
+
+        self.reactor.callLater(delay / self.speed, deliver)
+
+    def control(self, actor, cmdStr, callFunc):
+        if 'abortExposure' in cmdStr or 'finishExposure' in cmdStr:
+            code = 'F' if 'abortExposure' in cmdStr else ':'
+            for cmdId, running in list(self.running.items()):
+                self.running.pop(cmdId)
+                self.reactor.callLater(0, running, reply(actor, code, text=(f'{cmdStr} from sequencePanel',)))
+
+        if callFunc is not None:
+            self.reactor.callLater(0, callFunc, reply(actor, ':'))
+
+
+class SimActor(object):
+    """ Local actor, commands never leave the panel. """
+
+    def __init__(self, reactor, script, speed=1.0):
+        self.cmdr = SimCmdr(reactor, script, speed=speed)
+
+    def disconnectActor(self):
+        self.cmdr.running.clear()
+
+
+def connectActor(reactor, script=None, speed=1.0):
+    script = SyntheticScript() if script is None else RecordedScript(script)
+    return SimActor(reactor, script, speed=speed)
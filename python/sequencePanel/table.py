@@ -1,142 +1,489 @@
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QColor
-from PyQt5.QtWidgets import QTableWidget, QTableWidgetItem, QScrollBar
+from collections import Counter
+
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QItemSelection, QItemSelectionModel, QEvent, QSize, \
+    QTimer
+from PyQt5.QtGui import QColor, QIcon, QFontMetrics
+from PyQt5.QtWidgets import QTableView, QScrollBar, QStyledItemDelegate, QStyleOptionViewItem, QStyle, QApplication, \
+    QHeaderView, QAbstractItemView
+from sequencePanel.blockindex import BlockIndex
+from sequencePanel.widgets import getIcon, loadIcons
+
+
+class RefreshScheduler(object):
+    """ Collect dirty cmdRows and flush them to the model at most once per frame.
+    nRequests counts every refresh request, nFlush the actual flushes and suppressed the redraws saved. """
+
+    def __init__(self, model, rate):
+        self.model = model
+        self.dirty = dict()
+        self.nRequests = 0
+        self.nFlush = 0
+        self.timer = QTimer(model)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.flush)
+        self.setRate(rate)
 
+    @property
+    def suppressed(self):
+        return self.nRequests - self.nFlush
+
+    def setRate(self, rate):
+        """ Set maximum refresh rate in Hz. """
+        self.timer.setInterval(int(round(1000 / rate)))
+
+    def markDirty(self, cmdRow):
+        self.nRequests += 1
+        self.dirty[cmdRow] = True
+
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def flush(self):
+        """ Push every pending cmdRow update to the model, called by the timer or before any structural change. """
+        self.timer.stop()
+        if not self.dirty:
+            return
 
-class CenteredItem(QTableWidgetItem):
+        dirty, self.dirty = self.dirty, dict()
+        self.nFlush += 1
+
+        for cmdRow in dirty:
+            self.model.updateCmdRow(cmdRow)
+
+
+class SequenceModel(QAbstractTableModel):
+    """ Table model backed by panelwidget.cmdRows.
+    Each cmdRow occupies a block of model rows, the first one holds the cmdRow itself, the following ones its
+    remaining subcommands when they are shown. """
     color = {"init": ("#FF7D7D", "#000000"), "valid": ("#7DFF7D", "#000000"), "active": ("#4A90D9", "#FFFFFF"),
-             "finished": ("#5f9d63", "#FFFFFF"), "failed": ("#9d5f5f", "#FFFFFF"),  "cancelled": ("#BC8F8F", "#FFFFFF")}
+             "finished": ("#5f9d63", "#FFFFFF"), "failed": ("#9d5f5f", "#FFFFFF"), "cancelled": ("#BC8F8F", "#FFFFFF")}
+    colnames = ['', '', '', '', 'Valid', ' Id', 'Type', 'Name', 'Comments', 'CmdStr', 'VisitStart', 'VisitEnd',
+                'ReturnStr', 'Label', 'After', 'ETA (UTC)', 'Retry']
+    attrs = {5: 'id', 6: 'seqtype', 7: 'name', 8: 'comments', 9: 'cmdStr', 10: 'visitStart', 11: 'visitEnd',
+             12: 'returnStr', 13: 'label', 14: 'dependsStr', 15: 'etaStr', 16: 'attemptStr'}
+    controls = {0: ('remove', 'delete.png'), 1: ('moveUp', 'arrow_up2.png'), 2: ('moveDown', 'arrow_down2.png'),
+                3: ('showSubcommands', None), 4: ('toggleValid', None)}
+    editable = [7, 8, 9, 13, 14]
+    subColumn = 9
+    depColumns = [13, 14, 15, 16]
+    refreshRate = 30
+
+    def __init__(self, panelwidget):
+        QAbstractTableModel.__init__(self)
+        self.panelwidget = panelwidget
+        self.blocks = BlockIndex([])
+        self.contiguous = True
+        self.refresh = RefreshScheduler(self, rate=SequenceModel.refreshRate)
+        self.relayout()
+
+        self.cmdRows.connect('aboutToInsert', self.beginInsertCmdRows)
+        self.cmdRows.connect('inserted', self.endInsertCmdRows)
+        self.cmdRows.connect('aboutToRemove', self.beginRemoveCmdRows)
+        self.cmdRows.connect('removed', self.endRemoveCmdRows)
+        self.cmdRows.connect('aboutToMove', self.beginMoveCmdRows)
+        self.cmdRows.connect('moved', self.endMoveCmdRows)
+        self.cmdRows.connect('aboutToReorder', self.beginReorderCmdRows)
+        self.cmdRows.connect('reordered', self.endReorderCmdRows)
+        self.cmdRows.connect('rowChanged', self.refresh.markDirty)
+
+    @property
+    def cmdRows(self):
+        return self.panelwidget.cmdRows
+
+    def relayout(self):
+        """ Rebuild the block index after a structural change, only needed when cmdRows order changes. """
+        self.blocks = BlockIndex([cmdRow.nbRows for cmdRow in self.cmdRows])
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.blocks.total
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(SequenceModel.colnames)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return SequenceModel.colnames[section]
+
+    def locate(self, row):
+        """ Return the cmdRow owning that model row and the row offset within its block. """
+        pos, nb = self.blocks.locate(row)
+        return self.cmdRows[pos], nb
 
-    def __init__(self, cmdRow, attr, typeFunc, lock=False, align=Qt.AlignCenter):
-        self.cmdRow = cmdRow
-        self.attr = attr
-        self.typeFunc = typeFunc
-        QTableWidgetItem.__init__(self, str(getattr(cmdRow, attr)))
-        self.setTextAlignment(align)
+    def cellObject(self, row, column):
+        """ Return the object (cmdRow or subcommand) displayed in that cell, None for empty cells. """
+        cmdRow, nb = self.locate(row)
 
-        if lock:
-            self.setFlags(Qt.ItemIsSelectable | Qt.ItemIsEnabled)
+        if column < SequenceModel.subColumn or column in SequenceModel.depColumns:
+            return cmdRow if not nb else None
 
-        back, col = CenteredItem.color[cmdRow.status]
+        if cmdRow.showSub and cmdRow.cmds:
+            return cmdRow.subcommands[nb]
 
-        self.setForeground(QColor(col))
-        self.setBackground(QColor(back))
+        return cmdRow if not nb else None
 
-    def valueChanged(self):
-        if self.cmdRow.status == 'init':
-            val = self.text()
-            setattr(self.cmdRow, self.attr, self.typeFunc(val))
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+
+        obj = self.cellObject(index.row(), index.column())
+
+        if role in [Qt.DisplayRole, Qt.EditRole]:
+            try:
+                return str(getattr(obj, SequenceModel.attrs[index.column()]))
+            except (KeyError, AttributeError):
+                return None
+
+        if role == Qt.DecorationRole and obj is not None and index.column() in SequenceModel.controls:
+            __, iconFile = SequenceModel.controls[index.column()]
+            if index.column() == 3:
+                iconFile = 'eye_off.png' if obj.showSub else 'eye_on.png'
+            return getIcon(iconFile) if iconFile is not None else None
+
+        if role == Qt.CheckStateRole and obj is not None and index.column() == 4:
+            return Qt.Unchecked if obj.status == 'init' else Qt.Checked
+
+        if role == Qt.TextAlignmentRole:
+            return Qt.AlignCenter
+
+        if role in [Qt.BackgroundRole, Qt.ForegroundRole]:
+            obj = self.locate(index.row())[0] if obj is None else obj
+            back, col = SequenceModel.color[obj.status]
+            return QColor(back) if role == Qt.BackgroundRole else QColor(col)
+
+    def flags(self, index):
+        # root index, asked for while dragging over the viewport.
+        if not index.isValid():
+            return Qt.ItemIsDropEnabled
+
+        flags = Qt.ItemIsSelectable | Qt.ItemIsEnabled | Qt.ItemIsDragEnabled | Qt.ItemIsDropEnabled
+        cmdRow, nb = self.locate(index.row())
+
+        if index.column() in SequenceModel.controls:
+            if nb:
+                return Qt.NoItemFlags
+            elif index.column() == 3:
+                return Qt.ItemIsEnabled if cmdRow.expandable else Qt.NoItemFlags
+            elif index.column() == 4:
+                return Qt.ItemIsEnabled | Qt.ItemIsUserCheckable if cmdRow.status in ['init', 'valid'] else Qt.NoItemFlags
+
+            return Qt.ItemIsEnabled
+
+        if not nb and index.column() in SequenceModel.editable and cmdRow.status == 'init':
+            flags |= Qt.ItemIsEditable
+
+        return flags
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if role != Qt.EditRole or not self.flags(index) & Qt.ItemIsEditable:
+            return False
+
+        cmdRow, __ = self.locate(index.row())
+        setattr(cmdRow, SequenceModel.attrs[index.column()], str(value))
+        self.dataChanged.emit(index, index)
+        cmdRow.emit('rowChanged')
+        return True
+
+    def trigger(self, index):
+        """ Call the cmdRow method bound to that control cell. """
+        if not self.flags(index) & Qt.ItemIsEnabled:
+            return False
+
+        cmdRow, __ = self.locate(index.row())
+        method, __ = SequenceModel.controls[index.column()]
+        getattr(cmdRow, method)()
+        return True
+
+    def beginInsertCmdRows(self, pos, cmdRows):
+        self.refresh.flush()
+        first = self.blocks.start(pos)
+        nbRows = sum([cmdRow.nbRows for cmdRow in cmdRows])
+        self.beginInsertRows(QModelIndex(), first, first + nbRows - 1)
+
+    def endInsertCmdRows(self, pos, cmdRows):
+        self.relayout()
+        self.endInsertRows()
+
+    def beginRemoveCmdRows(self, positions):
+        """ Contiguous blocks are removed as such, anything else is a single model reset. """
+        self.refresh.flush()
+        self.contiguous = positions[-1] - positions[0] + 1 == len(positions)
+
+        if self.contiguous:
+            first, last = self.blocks.start(positions[0]), self.blocks.start(positions[-1] + 1) - 1
+            self.beginRemoveRows(QModelIndex(), first, last)
         else:
-            self.setText(str(getattr(self.cmdRow, self.attr)))
+            self.beginResetModel()
+
+    def endRemoveCmdRows(self, positions, cmdRows):
+        self.relayout()
+        self.endRemoveRows() if self.contiguous else self.endResetModel()
+
+    def beginMoveCmdRows(self, positions, dest):
+        """ A contiguous block is moved as such, persistent indexes follow it, anything else is a single reset. """
+        self.refresh.flush()
+        self.contiguous = positions[-1] - positions[0] + 1 == len(positions)
+
+        if self.contiguous:
+            first, last = self.blocks.start(positions[0]), self.blocks.start(positions[-1] + 1) - 1
+            # destination is expressed in rows before the move, a move Qt refuses falls back to a reset.
+            self.contiguous = self.beginMoveRows(QModelIndex(), first, last, QModelIndex(), self.blocks.start(dest))
+
+        if not self.contiguous:
+            self.beginResetModel()
+
+    def endMoveCmdRows(self, positions, dest):
+        self.relayout()
+        self.endMoveRows() if self.contiguous else self.endResetModel()
+
+    def beginReorderCmdRows(self):
+        self.refresh.flush()
+        self.beginResetModel()
+
+    def endReorderCmdRows(self):
+        self.relayout()
+        self.endResetModel()
+
+    def updateCmdRow(self, cmdRow):
+        """ Refresh a single cmdRow block, inserting or removing subcommand rows if its size changed. """
+        pos = self.cmdRows.index(cmdRow)
+        if pos is None:
+            return
+
+        first = self.blocks.start(pos)
+        current, nbRows = self.blocks.size(pos), cmdRow.nbRows
+
+        if nbRows > current:
+            self.beginInsertRows(QModelIndex(), first + current, first + nbRows - 1)
+            self.blocks.resize(pos, nbRows)
+            self.endInsertRows()
+
+        elif nbRows < current:
+            self.beginRemoveRows(QModelIndex(), first + nbRows, first + current - 1)
+            self.blocks.resize(pos, nbRows)
+            self.endRemoveRows()
+
+        self.dataChanged.emit(self.index(first, 0), self.index(first + nbRows - 1, self.columnCount() - 1))
+
+
+class ControlDelegate(QStyledItemDelegate):
+    """ Paint cmdRow controls from the model and handle clicks, so no widget is created per row. """
+    width = 22
+
+    def paint(self, painter, option, index):
+        painter.fillRect(option.rect, index.data(Qt.BackgroundRole))
+        enabled = bool(index.flags() & Qt.ItemIsEnabled)
+
+        icon = index.data(Qt.DecorationRole)
+        if icon is not None:
+            mode = QIcon.Normal if enabled else QIcon.Disabled
+            icon.paint(painter, option.rect.adjusted(1, 1, -1, -1), Qt.AlignCenter, mode)
+
+        checkState = index.data(Qt.CheckStateRole)
+        if checkState is not None:
+            opt = QStyleOptionViewItem(option)
+            opt.rect = self.checkRect(option)
+            opt.state = QStyle.State_On if checkState == Qt.Checked else QStyle.State_Off
+            opt.state |= QStyle.State_Enabled if enabled else QStyle.State_None
+            style = option.widget.style() if option.widget is not None else QApplication.style()
+            style.drawPrimitive(QStyle.PE_IndicatorItemViewItemCheck, opt, painter, option.widget)
 
+    def checkRect(self, option, size=12):
+        rect = option.rect
+        return rect.adjusted((rect.width() - size) // 2, (rect.height() - size) // 2,
+                             -((rect.width() - size + 1) // 2), -((rect.height() - size + 1) // 2))
 
-class Table(QTableWidget):
-    colwidthRatio = {6: 0.12, 7: 0.15, 8: 0.43, 11: 0.3}
-    colnames = ['', '', '', 'Valid', ' Id', 'Type', 'Name', 'Comments', 'CmdStr', 'VisitStart', 'VisitEnd', 'ReturnStr']
+    def sizeHint(self, option, index):
+        return QSize(ControlDelegate.width, 16)
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() != QEvent.MouseButtonRelease or event.button() != Qt.LeftButton:
+            return False
+
+        if not option.rect.contains(event.pos()):
+            return False
+
+        return model.trigger(index)
+
+
+class ColumnLayout(object):
+    """ Width of the columns which are not sized by ratio, computed from the widest value of each column.
+    Text widths come from a font metrics cache and per-column width counts are updated incrementally as cmdRows are
+    added, changed or removed, so no cell needs to be measured by the view. """
+    padding = 12
+
+    def __init__(self, table):
+        self.metrics = QFontMetrics(table.font())
+        self.textWidths = dict()
+        self.rowWidths = dict()
+
+        headerMetrics = QFontMetrics(table.horizontalHeader().font())
+        self.columns = [col for col in range(len(SequenceModel.colnames)) if col not in Table.colwidthRatio]
+        self.measured = [col for col in self.columns if col in SequenceModel.attrs]
+        self.counts = dict([(col, Counter()) for col in self.measured])
+        self.minWidths = dict([(col, headerMetrics.horizontalAdvance(SequenceModel.colnames[col]) + self.padding)
+                               for col in self.columns])
+
+        for col in SequenceModel.controls:
+            self.minWidths[col] = max(self.minWidths[col], ControlDelegate.width)
+
+    def textWidth(self, text):
+        try:
+            return self.textWidths[text]
+        except KeyError:
+            self.textWidths[text] = self.metrics.horizontalAdvance(text) + self.padding
+
+        return self.textWidths[text]
+
+    def addRow(self, cmdRow):
+        widths = tuple([self.textWidth(str(getattr(cmdRow, SequenceModel.attrs[col]))) for col in self.measured])
+        self.rowWidths[cmdRow] = widths
+
+        for col, width in zip(self.measured, widths):
+            self.counts[col][width] += 1
+
+    def removeRow(self, cmdRow):
+        for col, width in zip(self.measured, self.rowWidths.pop(cmdRow, ())):
+            self.counts[col][width] -= 1
+            if not self.counts[col][width]:
+                del self.counts[col][width]
+
+    def updateRow(self, cmdRow):
+        self.removeRow(cmdRow)
+        self.addRow(cmdRow)
+
+    def widths(self):
+        widths = dict(self.minWidths)
+        for col, counts in self.counts.items():
+            widths[col] = max([widths[col]] + list(counts))
+
+        return widths
+
+
+class Table(QTableView):
+    colwidthRatio = {7: 0.12, 8: 0.15, 9: 0.43, 12: 0.3}
 
     def __init__(self, panelwidget):
         self.panelwidget = panelwidget
         self.controlKey = False
 
-        nbRows = sum([cmdRow.nbRows for cmdRow in self.cmdRows])
+        QTableView.__init__(self)
+        self.setModel(SequenceModel(panelwidget))
 
-        QTableWidget.__init__(self, nbRows, len(Table.colnames))
+        # uniform row heights, the view only lays out and paints the rows within the viewport.
+        self.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.verticalHeader().setDefaultSectionSize(16)
+        self.verticalHeader().hide()
 
-        self.setHorizontalHeaderLabels(Table.colnames)
+        # multi-row reorder by drag and drop, handled in dropEvent.
+        self.setDragEnabled(True)
+        self.setAcceptDrops(True)
+        self.setDragDropMode(QAbstractItemView.DragDrop)
+        self.setDragDropOverwriteMode(False)
+        self.setDropIndicatorShown(True)
 
-        self.verticalHeader().setDefaultSectionSize(6)
-        self.verticalHeader().hide()
+        loadIcons(['delete.png', 'arrow_up2.png', 'arrow_down2.png', 'eye_on.png', 'eye_off.png'])
+        self.controlDelegate = ControlDelegate(self)
+        for col in SequenceModel.controls:
+            self.setItemDelegateForColumn(col, self.controlDelegate)
 
-        rowNumber = 0
-        for cmdRow in self.cmdRows:
-            cmdRow.rowNumber = rowNumber
-            self.setRowHeight(rowNumber, 14)
-            self.setRowHeight(rowNumber + 1, 14)
-
-            self.setCellWidget(rowNumber, 0, cmdRow.buttonDelete)
-            self.setCellWidget(rowNumber, 1, cmdRow.buttonMoveUp)
-            self.setCellWidget(rowNumber + 1, 1, cmdRow.buttonMoveDown)
-            self.setCellWidget(rowNumber, 2, cmdRow.buttonEye)
-            self.setCellWidget(rowNumber, 3, cmdRow.valid)
-            self.setItem(rowNumber, 4, CenteredItem(cmdRow, 'id', int, lock=True))
-            self.setItem(rowNumber, 5, CenteredItem(cmdRow, 'seqtype', str, lock=True))
-            self.setItem(rowNumber, 6, CenteredItem(cmdRow, 'name', str))
-            self.setItem(rowNumber, 7, CenteredItem(cmdRow, 'comments', str))
-
-            nb = 2
-            if cmdRow.showSub and cmdRow.subcommands:
-                if len(cmdRow.subcommands) > 1:
-                    span = len(cmdRow.subcommands)
-                    cols = [0, 2, 3, 4, 5, 6, 7]
-                    for nb, subcommand in enumerate(cmdRow.subcommands):
-                        self.setRowHeight(rowNumber + nb, 16)
-                        self.setItem(rowNumber + nb, 8, CenteredItem(subcommand, 'cmdStr', str))
-                        self.setItem(rowNumber + nb, 9, CenteredItem(subcommand, 'visitStart', int, lock=True))
-                        self.setItem(rowNumber + nb, 10, CenteredItem(subcommand, 'visitEnd', int, lock=True))
-                        self.setItem(rowNumber + nb, 11, CenteredItem(subcommand, 'returnStr', str, lock=True))
-                    nb += 1
-                else:
-                    subcommand = cmdRow.subcommands[0]
-                    span = 2
-                    cols = [0, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11]
-                    self.setItem(rowNumber, 8, CenteredItem(subcommand, 'cmdStr', str))
-                    self.setItem(rowNumber, 9, CenteredItem(subcommand, 'visitStart', int, lock=True))
-                    self.setItem(rowNumber, 10, CenteredItem(subcommand, 'visitEnd', int, lock=True))
-                    self.setItem(rowNumber, 11, CenteredItem(subcommand, 'returnStr', str))
-
-            else:
-                span = 2
-                cols = [0, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11]
-                self.setItem(rowNumber, 8, CenteredItem(cmdRow, 'cmdStr', str))
-                self.setItem(rowNumber, 9, CenteredItem(cmdRow, 'visitStart', int, lock=True))
-                self.setItem(rowNumber, 10, CenteredItem(cmdRow, 'visitEnd', int, lock=True))
-                self.setItem(rowNumber, 11, CenteredItem(cmdRow, 'returnStr', str))
-
-            for col in cols:
-                self.setSpan(rowNumber, col, span, 1)
-
-            rowNumber += nb
-
-        self.cellChanged.connect(self.userCellChanged)
         self.setFont(self.getFont())
         self.horizontalHeader().setFont(self.getFont(size=11))
 
+        self.availableWidth = 0
+        self.columnWidths = dict()
+        self.columnLayout = ColumnLayout(self)
+        self.cmdRows.connect('inserted', self.rowsAdded)
+        self.cmdRows.connect('removed', self.rowsRemoved)
+        self.cmdRows.connect('rowChanged', self.rowChanged)
+
         self.setVerticalScrollBar(VScrollBar(self))
 
     @property
     def cmdRows(self):
         return self.panelwidget.cmdRows
 
-    def resizeEvent(self, event):
-        autoResize = [j for j in range(len(Table.colnames)) if j not in Table.colwidthRatio]
-        for j in autoResize:
-            self.resizeColumnToContents(j)
+    def rowsAdded(self, pos, cmdRows):
+        for cmdRow in cmdRows:
+            self.columnLayout.addRow(cmdRow)
+
+        self.applyColumnWidths()
 
-        remainingWidth = event.size().width() - sum([self.columnWidth(j) for j in autoResize])
+    def rowsRemoved(self, positions, cmdRows):
+        for cmdRow in cmdRows:
+            self.columnLayout.removeRow(cmdRow)
+
+        self.applyColumnWidths()
+
+    def rowChanged(self, cmdRow):
+        if cmdRow in self.columnLayout.rowWidths:
+            self.columnLayout.updateRow(cmdRow)
+            self.applyColumnWidths()
+
+    def applyColumnWidths(self):
+        """ Apply cached column widths, only touching the columns whose width actually changed. """
+        widths = self.columnLayout.widths()
+        remainingWidth = self.availableWidth - sum(widths.values())
 
         for col, ratio in Table.colwidthRatio.items():
-            self.setColumnWidth(col, int(round(ratio * remainingWidth)))
+            widths[col] = int(round(ratio * remainingWidth))
 
-        QTableWidget.resizeEvent(self, event)
+        for col, width in widths.items():
+            if self.columnWidths.get(col) != width:
+                self.setColumnWidth(col, width)
+
+        self.columnWidths = widths
+
+    def resizeEvent(self, event):
+        if event.size().width() != self.availableWidth:
+            self.availableWidth = event.size().width()
+            self.applyColumnWidths()
+
+        QTableView.resizeEvent(self, event)
 
     def getFont(self, size=10):
         font = self.font()
         font.setPixelSize(size)
         return font
 
-    def userCellChanged(self, row, column):
-        self.item(row, column).valueChanged()
+    def selectedCmdRows(self):
+        """ Return selected cmdRows, sorted by their position in the table.
+        Selection ranges are used rather than indexes, so selecting the whole history stays cheap. """
+        blocks = self.model().blocks
+        positions = set()
+
+        for selectionRange in self.selectionModel().selection():
+            first, __ = blocks.locate(selectionRange.top())
+            last, __ = blocks.locate(selectionRange.bottom())
+            positions.update(range(first, last + 1))
 
-    def setRowSelected(self, row, bool):
-        for col in range(4, 12):
-            self.item(row, col).setSelected(bool)
+        return [self.cmdRows[pos] for pos in sorted(positions)]
 
     def selectAll(self):
-        for i in range(self.rowCount()):
-            try:
-                self.setRowSelected(i, True)
-            except AttributeError:
-                pass
+        model = self.model()
+        if not model.rowCount():
+            return
+
+        selection = QItemSelection(model.index(0, 5), model.index(model.rowCount() - 1, model.columnCount() - 1))
+        self.selectionModel().select(selection, QItemSelectionModel.Select)
+
+    def dropEvent(self, event):
+        """ Move selected cmdRows as a block in front of the drop target. """
+        if event.source() is not self:
+            event.ignore()
+            return
+
+        row = self.indexAt(event.pos()).row()
+        if row == -1:
+            dest = len(self.cmdRows)
+        else:
+            dest, __ = self.model().blocks.locate(row)
+            dest += int(self.dropIndicatorPosition() == QAbstractItemView.BelowItem)
+
+        self.cmdRows.moveRows(self.selectedCmdRows(), dest)
+
+        # copy action, so the view does not try to remove the source rows.
+        event.setDropAction(Qt.CopyAction)
+        event.accept()
 
     def keyPressEvent(self, QKeyEvent):
 
@@ -145,25 +492,21 @@ class Table(QTableWidget):
                 self.controlKey = True
 
             if QKeyEvent.key() == Qt.Key_C and self.controlKey:
-
-                cmdRows = list(set([item.cmdRow for item in self.selectedItems()]))
-                sortedRows = sorted([(self.cmdRows.index(cmdRow), cmdRow) for cmdRow in cmdRows], key=lambda t: t[0])
-                self.panelwidget.copy([cmdRow for i, cmdRow in sortedRows])
-
-                for range in self.selectedRanges():
-                    self.setRangeSelected(range, False)
+                self.panelwidget.copy(self.selectedCmdRows())
+                self.clearSelection()
 
             elif QKeyEvent.key() == Qt.Key_V and self.controlKey:
-                if self.selectedRanges():
-                    ind = max([range.bottomRow() for range in self.selectedRanges()]) // 2
+                selection = self.selectionModel().selection()
+                if not selection.isEmpty():
+                    row = max([selectionRange.bottom() for selectionRange in selection])
+                    ind, __ = self.model().blocks.locate(row)
                 else:
                     ind = len(self.cmdRows)
 
                 self.panelwidget.paste(ind)
 
             if QKeyEvent.key() == Qt.Key_Delete:
-                cmdRows = list(set([item.cmdRow for item in self.selectedItems()]))
-                self.panelwidget.remove(cmdRows)
+                self.panelwidget.remove(self.selectedCmdRows())
 
         except KeyError:
             pass
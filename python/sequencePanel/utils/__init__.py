@@ -1,29 +1,11 @@
 import re
 
-import pandas as pd
-from ics.utils.opdb import opDB
+options = re.compile(r'(\w+)=("[^"]*"|\S+)')
 
 
-def visitsFromSet(iic_sequence_id):
-    return opDB.fetchall(f'select pfs_visit_id from visit_set where iic_sequence_id={iic_sequence_id}')
-
-
-def spsExposure(visits):
-    columns = ['visit', 'exptype','exptime',  'specNum', 'arm', 'camId']
-    dfs = [pd.DataFrame([], columns=columns)]
-    for visit, in visits:
-        try:
-            exposures = opDB.fetchall(f'select sps_exposure.pfs_visit_id,exp_type,exptime,sps_module_id,arm,'
-                                      f'sps_exposure.sps_camera_id from sps_exposure inner join sps_visit on '
-                                      f'sps_exposure.pfs_visit_id=sps_visit.pfs_visit_id inner join sps_camera '
-                                      f'on sps_exposure.sps_camera_id = sps_camera.sps_camera_id where '
-                                      f'sps_exposure.pfs_visit_id={visit}')
-            dfs.append(pd.DataFrame(exposures, columns=columns))
-
-        except ValueError:
-            pass
-
-    return pd.concat(dfs, ignore_index=True)
+def parseOptions(cmdStr):
+    """ Return key=value options of cmdStr as a dict, quotes stripped from values """
+    return dict([(key, value.strip('"')) for key, value in options.findall(cmdStr)])
 
 
 def stripQuotes(txt):
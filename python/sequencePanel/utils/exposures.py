@@ -0,0 +1,29 @@
+__author__ = 'alefur'
+
+import pandas as pd
+from sequencePanel.queries import queries
+
+
+def visitsFromSet(iic_sequence_id):
+    return queries.fetchall('visitsFromSet', int(iic_sequence_id))
+
+
+exposureColumns = ['visit', 'exptype', 'exptime', 'specNum', 'arm', 'camId', 'dataFlag', 'notes']
+exposureTypes = dict(visit='int64', exptype=str, exptime='float64', specNum='int64', arm=str, camId='int64')
+
+
+def exposureFrame(exposures):
+    """ Typed DataFrame from sps exposure rows, which may be empty, dataFlag and notes are '' when not annotated """
+    frame = pd.DataFrame(exposures, columns=exposureColumns, dtype=object).astype(exposureTypes)
+    return frame.fillna(dict(dataFlag='', notes=''))
+
+
+def sequenceExposures(iic_sequence_ids):
+    """ SpS exposures of one or several iic sequences, fetched at once """
+    ids = [iic_sequence_ids] if isinstance(iic_sequence_ids, int) else list(iic_sequence_ids)
+    return exposureFrame(queries.fetchall('sequenceExposures', [int(iic_sequence_id) for iic_sequence_id in ids]))
+
+
+def spsExposure(visits):
+    """ SpS exposures of (visit,) rows as returned by visitsFromSet, fetched at once """
+    return exposureFrame(queries.fetchall('visitExposures', [int(visit) for visit, in visits]))
@@ -8,6 +8,7 @@ from PyQt5.QtGui import QPixmap, QIcon
 from PyQt5.QtWidgets import QPushButton, QSpinBox, QComboBox, QLineEdit, QLabel, QProgressBar
 
 imgpath = os.path.abspath(os.path.join(os.path.dirname(sequencePanel.__file__), '../..', 'img'))
+icons = dict()
 
 
 class Label(QLabel):
@@ -97,27 +98,20 @@ class ProgressBar(QProgressBar):
 class IconButton(QPushButton):
     def __init__(self, iconFile):
         QPushButton.__init__(self)
-        pix = QPixmap()
-        pix.load('%s/%s' % (imgpath, iconFile))
-        icon = QIcon(pix)
-        self.setIcon(icon)
+        self.setIcon(getIcon(iconFile))
 
 
-class EyeButton(QPushButton):
-    def __init__(self):
-        QPushButton.__init__(self)
-        pixon = QPixmap()
-        pixon.load('%s/%s' % (imgpath, 'eye_on.png'))
-        self.icon_on = QIcon(pixon)
+def getIcon(iconFile):
+    """ Return icon from the process-wide cache, the image file is only read the first time. """
+    try:
+        return icons[iconFile]
+    except KeyError:
+        icons[iconFile] = QIcon(QPixmap('%s/%s' % (imgpath, iconFile)))
 
-        pixon = QPixmap()
-        pixon.load('%s/%s' % (imgpath, 'eye_off.png'))
-        self.icon_off = QIcon(pixon)
+    return icons[iconFile]
 
-        self.setState(False)
-        self.setEnabled(False)
 
-    def setState(self, state):
-        icon = self.icon_on if not state else self.icon_off
-        self.setIcon(icon)
-        self.state = state
+def loadIcons(iconFiles):
+    """ Fill the icon cache at startup, QApplication needs to exist. """
+    for iconFile in iconFiles:
+        getIcon(iconFile)
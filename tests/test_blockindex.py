@@ -0,0 +1,46 @@
+import random
+
+from sequencePanel.blockindex import BlockIndex
+
+
+def bruteStart(sizes, pos):
+    return sum(sizes[:pos])
+
+
+def bruteLocate(sizes, row):
+    for pos, size in enumerate(sizes):
+        if row < size:
+            return pos, row
+        row -= size
+
+
+def test_start_and_locate():
+    sizes = [1, 3, 1, 5, 2]
+    blocks = BlockIndex(sizes)
+
+    assert [blocks.start(pos) for pos in range(len(sizes) + 1)] == [0, 1, 4, 5, 10, 12]
+    assert blocks.total == 12
+    for row in range(12):
+        assert blocks.locate(row) == bruteLocate(sizes, row)
+
+
+def test_resize_matches_brute_force():
+    rng = random.Random(1)
+    sizes = [rng.randint(1, 5) for i in range(37)]
+    blocks = BlockIndex(sizes)
+
+    for i in range(200):
+        pos, size = rng.randrange(len(sizes)), rng.randint(1, 8)
+        sizes[pos] = size
+        blocks.resize(pos, size)
+
+        assert blocks.total == sum(sizes)
+        assert blocks.start(pos) == bruteStart(sizes, pos)
+        row = rng.randrange(sum(sizes))
+        assert blocks.locate(row) == bruteLocate(sizes, row)
+
+
+def test_empty():
+    blocks = BlockIndex([])
+    assert len(blocks) == 0
+    assert blocks.start(0) == 0
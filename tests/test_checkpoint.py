@@ -0,0 +1,73 @@
+import random
+
+from sequencePanel.checkpoint import QueueJournal
+from sequencePanel.cmdqueue import CmdQueue
+from sequencePanel.sequence import CmdRow
+
+
+def snapshot(cmdRows):
+    return [(cmdRow.name, cmdRow.status, cmdRow.uid, cmdRow.id, cmdRow.returnStr, cmdRow.dependsStr)
+            for cmdRow in cmdRows]
+
+
+def follow(root, cmdRows=None):
+    queue = CmdQueue(cmdRows)
+    queue.checkConsistency = True
+    checkpoint = QueueJournal(root)
+    checkpoint.follow(queue)
+    return queue, checkpoint
+
+
+def test_replay_equivalence(tmp_path, monkeypatch):
+    monkeypatch.setattr(QueueJournal, 'snapshotEvery', 40)
+    rng = random.Random(3)
+    queue, checkpoint = follow(str(tmp_path))
+    names = iter(range(10000))
+
+    for i in range(500):
+        action = rng.choice(['insert', 'insert', 'remove', 'move', 'reorder', 'status', 'edit'])
+        if action == 'insert' or not len(queue):
+            queue.insert(rng.randint(0, len(queue)),
+                         [CmdRow(f'row{next(names)}', '', 'iic bias') for j in range(rng.randint(1, 3))])
+        elif action == 'remove':
+            queue.remove(rng.sample(list(queue), rng.randint(1, min(2, len(queue)))))
+        elif action == 'move':
+            queue.moveRows(rng.sample(list(queue), rng.randint(1, min(3, len(queue)))), rng.randint(0, len(queue)))
+        elif action == 'reorder':
+            queue.reorder(rng.sample(list(queue), len(queue)))
+        elif action == 'status':
+            rng.choice(list(queue)).setStatus(rng.choice(['init', 'valid', 'finished', 'failed']))
+        else:
+            cmdRow = rng.choice(list(queue))
+            cmdRow.returnStr, cmdRow.id, cmdRow.dependsStr = f'text="{i}"', i, rng.choice(['', 'a', '!b'])
+            cmdRow.emit('rowChanged')
+
+    checkpoint.close()
+    assert snapshot(QueueJournal(str(tmp_path)).load()) == snapshot(queue)
+
+
+def test_removed_row_changes_are_ignored(tmp_path):
+    cmdRows = [CmdRow(name, '', 'iic bias') for name in 'AXY']
+    queue, checkpoint = follow(str(tmp_path), cmdRows)
+    for cmdRow in cmdRows:
+        cmdRow.setValid()
+
+    queue.remove([cmdRows[0]])
+    cmdRows[0].returnStr = 'late reply'
+    # a notification already on its way when the row was removed.
+    checkpoint.rowChanged(cmdRows[0])
+    cmdRows[1].setFinished()
+    checkpoint.close()
+
+    assert snapshot(QueueJournal(str(tmp_path)).load()) == snapshot(queue)
+
+
+def test_damaged_log_stops_replay(tmp_path):
+    queue, checkpoint = follow(str(tmp_path), [CmdRow('A', '', 'iic bias')])
+    queue.append(CmdRow('B', '', 'iic bias'))
+    checkpoint.close()
+
+    with open(checkpoint.logPath(checkpoint.generation), 'ab') as logFile:
+        logFile.write(b'\x00\x00\x00\n{"op":"remove","positions":[0]}\n')
+
+    assert [cmdRow.name for cmdRow in QueueJournal(str(tmp_path)).load()] == ['A', 'B']
@@ -0,0 +1,99 @@
+import random
+
+import pytest
+from sequencePanel.cmdqueue import CmdQueue
+from sequencePanel.sequence import CmdRow
+
+
+def makeRows(n):
+    return [CmdRow(f'row{i}', '', f'iic bias duplicate={i + 1}') for i in range(n)]
+
+
+@pytest.fixture
+def queue():
+    cmdRows = CmdQueue()
+    cmdRows.checkConsistency = True
+    return cmdRows
+
+
+def test_insert_positions(queue):
+    first, second = makeRows(3), makeRows(2)
+    queue.insert(0, first)
+    queue.insert(1, second)
+
+    assert list(queue) == [first[0]] + second + first[1:]
+    assert [cmdRow.position for cmdRow in queue] == list(range(5))
+
+
+def test_status_index(queue):
+    cmdRows = makeRows(4)
+    queue.insert(0, cmdRows)
+    cmdRows[1].setValid()
+    cmdRows[3].setValid()
+    cmdRows[1].setActive()
+
+    assert queue.count('init') == 2
+    assert queue.withStatus('valid') == [cmdRows[3]]
+    assert queue.first('active') is cmdRows[1]
+
+
+def test_remove_detaches_rows(queue):
+    cmdRows = makeRows(4)
+    queue.insert(0, cmdRows)
+    queue.remove([cmdRows[0], cmdRows[2]])
+
+    assert list(queue) == [cmdRows[1], cmdRows[3]]
+    assert cmdRows[0].queue is None and cmdRows[0].position is None
+    assert cmdRows[0] not in queue
+
+
+def test_remove_keeps_active_rows(queue):
+    cmdRows = makeRows(2)
+    queue.insert(0, cmdRows)
+    cmdRows[0].setActive()
+    queue.remove(cmdRows)
+
+    assert list(queue) == [cmdRows[0]]
+
+
+def test_move_rows(queue):
+    cmdRows = makeRows(6)
+    queue.insert(0, cmdRows)
+    queue.moveRows([cmdRows[1], cmdRows[2]], 5)
+
+    assert list(queue) == [cmdRows[0], cmdRows[3], cmdRows[4], cmdRows[1], cmdRows[2], cmdRows[5]]
+
+
+def test_random_edits_stay_consistent(queue):
+    rng = random.Random(0)
+    pool = makeRows(200)
+
+    for i in range(300):
+        action = rng.choice(['insert', 'remove', 'move', 'status', 'reorder'])
+        if action == 'insert' or not len(queue):
+            fresh = [cmdRow for cmdRow in pool if cmdRow.queue is None][:rng.randint(1, 3)]
+            queue.insert(rng.randint(0, len(queue)), fresh)
+        elif action == 'remove':
+            queue.remove(rng.sample(list(queue), rng.randint(1, min(3, len(queue)))))
+        elif action == 'move':
+            queue.moveRows(rng.sample(list(queue), rng.randint(1, min(3, len(queue)))), rng.randint(0, len(queue)))
+        elif action == 'status':
+            rng.choice(list(queue)).setStatus(rng.choice(['init', 'valid', 'finished', 'failed']))
+        else:
+            queue.reorder(rng.sample(list(queue), len(queue)))
+
+        # checkConsistency makes every edit verify positions and status indexes against a full scan.
+        assert [cmdRow.position for cmdRow in queue] == list(range(len(queue)))
+
+
+def test_drop_block_onto_itself(queue):
+    cmdRows = makeRows(6)
+    queue.insert(0, cmdRows)
+    events = []
+    queue.connect('aboutToMove', lambda *args: events.append(args))
+
+    for dest in range(2, 6):
+        queue.moveRows(cmdRows[2:5], dest)
+
+    assert events == []
+    assert list(queue) == cmdRows
@@ -0,0 +1,41 @@
+from sequencePanel.decoders import DecoderRegistry, SequenceInfo, registry
+from sequencePanel.sequence import CmdRow
+
+
+def test_register_and_decode():
+    decoders = DecoderRegistry()
+
+    @decoders.register('answer', handler='setAnswer')
+    def answer(value):
+        return int(value)
+
+    assert decoders.decode('answer', ('42',)) == ('setAnswer', 42)
+    assert decoders.decode('answer', ('x',)) is None
+    assert decoders.decode('answer', ()) is None
+    assert decoders.decode('question', ('?',)) is None
+    assert dict(decoders.unparsed) == dict(answer=2)
+    assert dict(decoders.unknown) == dict(question=1)
+
+
+def test_iic_keywords():
+    handler, info = registry.decode('sps_sequence', ('12', 'biases', 'iic bias', 'name', 'comments', 'active'))
+    assert (handler, info) == ('setSequenceInfo', SequenceInfo(12, 'biases', 'name', 'comments', 'iic bias', ''))
+
+    handler, info = registry.decode('subCommand', ('12', '3', 'sps expose bias', '0', 'fileids=1234,0,0xff'))
+    assert handler == 'updateSubCommand'
+    assert (info.id, info.didFail, info.visit, info.cameraMask) == (3, 0, 1234, '0xff')
+
+    handler, info = registry.decode('subCommand', ('12', '4', 'sps expose bias', '-1', ''))
+    assert (info.visit, info.cameraMask) == (-1, '')
+
+
+def test_row_update():
+    cmdRow = CmdRow('', '', 'iic bias duplicate=2')
+    cmdRow.updateInfo(dict(sps_sequence=('12', 'biases', 'iic bias', '', '', 'active'), unknownKey=('1',)))
+    for subId, didFail, returnStr in [(0, -1, ''), (1, -1, ''), (0, 0, 'fileids=101,0,0xff'),
+                                      (1, 0, 'fileids=100,0,0xff')]:
+        cmdRow.updateInfo(dict(subCommand=('12', str(subId), 'sps expose bias', str(didFail), returnStr)))
+
+    assert (cmdRow.id, cmdRow.seqtype, cmdRow.expandable) == (12, 'biases', True)
+    assert [subcommand.status for subcommand in cmdRow.subcommands] == ['finished', 'finished']
+    assert (cmdRow.visitStart, cmdRow.visitEnd) == (100, 101)
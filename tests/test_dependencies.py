@@ -0,0 +1,42 @@
+from sequencePanel.dependencies import DependencyGraph, formatDepends, parseDepends
+from sequencePanel.sequence import CmdRow
+
+
+def row(label, after='', ifFailed=''):
+    return CmdRow(label, '', 'iic bias', label=label, after=after, ifFailed=ifFailed)
+
+
+def test_parse_and_format():
+    depends = parseDepends('a, !b,, c ')
+    assert depends == [('a', 'finished'), ('b', 'failed'), ('c', 'finished')]
+    assert formatDepends(depends) == 'a, !b, c'
+
+
+def test_topological_keeps_queue_order():
+    d, a, b, c = row('d', after='b'), row('a'), row('b', after='a'), row('c')
+    sortedRows, cyclic = DependencyGraph([d, a, b, c]).topological()
+
+    assert [cmdRow.label for cmdRow in sortedRows] == ['a', 'b', 'd', 'c']
+    assert cyclic == []
+
+
+def test_cycle_detection():
+    a, b, c, e = row('a', after='c'), row('b', after='a'), row('c', after='b'), row('e', after='a')
+    free = row('free')
+    sortedRows, cyclic = DependencyGraph([a, b, c, e, free]).topological()
+
+    assert sortedRows == [free]
+    assert cyclic == [a, b, c, e]
+
+
+def test_state_and_unknown():
+    a, b, c, d = row('a'), row('b', after='a'), row('c', ifFailed='a'), row('d', after='missing')
+    graph = DependencyGraph([a, b, c, d])
+
+    assert graph.state(b) == 'waiting'
+    assert graph.state(d) == 'never'
+    assert graph.unknown() == [(d, 'missing')]
+
+    a.setFinished()
+    assert graph.state(b) == 'ready'
+    assert graph.state(c) == 'never'
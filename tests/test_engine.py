@@ -0,0 +1,245 @@
+import heapq
+import time
+from itertools import count
+
+import pytest
+from sequencePanel.cmdqueue import CmdQueue
+from sequencePanel.engine import SchedulerEngine
+from sequencePanel.sequence import CmdRow
+
+
+class DelayedCall(object):
+    def __init__(self, t, callback, args):
+        self.t = t
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+        self.called = False
+
+    def active(self):
+        return not (self.cancelled or self.called)
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Clock(object):
+    """ Fake reactor and time.time, time only moves through advance(). """
+
+    def __init__(self, now=1.7e9):
+        self.now = now
+        self.calls = []
+        self.counter = count()
+
+    def time(self):
+        return self.now
+
+    def callLater(self, delay, callback, *args):
+        call = DelayedCall(self.now + delay, callback, args)
+        heapq.heappush(self.calls, (call.t, next(self.counter), call))
+        return call
+
+    def advance(self, seconds):
+        end = self.now + seconds
+        while self.calls and self.calls[0][0] <= end:
+            t, __, call = heapq.heappop(self.calls)
+            self.now = max(self.now, t)
+            if call.active():
+                call.called = True
+                call.callback(*call.args)
+
+        self.now = end
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(time, 'time', clock.time)
+    monkeypatch.setattr(SchedulerEngine, 'lanes', 1)
+    monkeypatch.setattr(SchedulerEngine, 'lowLatency', False)
+    return clock
+
+
+def makeEngine(clock, cmdStrs, **kwargs):
+    return queueEngine(clock, [CmdRow(f'row{i}', '', cmdStr, **kwargs) for i, cmdStr in enumerate(cmdStrs)])
+
+
+def queueEngine(clock, cmdRows):
+    cmdRows = CmdQueue(cmdRows)
+    sent = []
+    engine = SchedulerEngine(cmdRows, clock, lambda **kwargs: sent.append(kwargs['fullCmd']))
+    states = []
+    engine.connect('stateChanged', states.append)
+
+    for cmdRow in cmdRows:
+        cmdRow.setValid()
+
+    return engine, cmdRows, states, sent
+
+
+def statuses(cmdRows):
+    return [cmdRow.status for cmdRow in cmdRows]
+
+
+def test_rows_run_one_after_the_other(clock):
+    engine, cmdRows, states, sent = makeEngine(clock, ['iic bias', 'iic dark exptime=10'])
+    engine.start()
+    assert engine.state == 'waiting'
+
+    clock.advance(SchedulerEngine.delayCmd)
+    assert statuses(cmdRows) == ['active', 'valid']
+    assert engine.state == 'processing'
+
+    cmdRows[0].terminate(code=':', returnStr='')
+    clock.advance(SchedulerEngine.delayCmd - 0.1)
+    assert statuses(cmdRows) == ['finished', 'valid']
+
+    clock.advance(0.1)
+    assert statuses(cmdRows) == ['finished', 'active']
+
+    cmdRows[1].terminate(code=':', returnStr='')
+    assert engine.state == 'off'
+    assert states[-1] == 'off'
+
+
+def test_start_time_is_awaited(clock):
+    engine, cmdRows, states, sent = makeEngine(clock, ['iic bias'], startAt=clock.now + 3600)
+    engine.start()
+
+    clock.advance(3599)
+    assert statuses(cmdRows) == ['valid']
+    assert engine.state == 'waiting'
+
+    clock.advance(1)
+    assert statuses(cmdRows) == ['active']
+
+
+def test_low_latency_dispatch(clock, monkeypatch):
+    monkeypatch.setattr(SchedulerEngine, 'lowLatency', True)
+    monkeypatch.setattr(SchedulerEngine, 'gap', 0)
+    engine, cmdRows, states, sent = makeEngine(clock, ['iic bias', 'iic bias'])
+    deadTimes = []
+    engine.connect('deadTime', lambda night, deadTime, stats: deadTimes.append(deadTime))
+    engine.start()
+    clock.advance(SchedulerEngine.delayCmd)
+
+    cmdRows[0].terminate(code=':', returnStr='')
+    assert statuses(cmdRows) == ['finished', 'active']
+    assert deadTimes == [0]
+
+
+def test_check(clock):
+    engine, cmdRows, states, sent = makeEngine(clock, ['iic bias'])
+    assert engine.check() is None
+
+    cmdRows[0].setValid(False)
+    assert engine.check() is not None
+
+
+def test_lanes_run_disjoint_rows_together(clock, monkeypatch):
+    monkeypatch.setattr(SchedulerEngine, 'lanes', 3)
+    engine, cmdRows, states, sent = makeEngine(clock, ['iic bias cam=b1', 'iic dark exptime=5 cam=r1',
+                                                       'iic bias cam=b1,b2', 'iic bias cam=n1'])
+    engine.start()
+    clock.advance(SchedulerEngine.delayCmd)
+
+    # the third row waits for the first one, the fourth one does not conflict.
+    assert statuses(cmdRows) == ['active', 'active', 'valid', 'active']
+
+    cmdRows[1].terminate(code=':', returnStr='')
+    clock.advance(SchedulerEngine.delayCmd)
+    assert statuses(cmdRows) == ['active', 'finished', 'valid', 'active']
+
+    cmdRows[0].terminate(code=':', returnStr='')
+    clock.advance(SchedulerEngine.delayCmd)
+    assert statuses(cmdRows) == ['finished', 'finished', 'active', 'active']
+
+
+def test_abort_latched_until_every_lane_is_done(clock, monkeypatch):
+    monkeypatch.setattr(SchedulerEngine, 'lanes', 2)
+    engine, cmdRows, states, sent = makeEngine(clock, ['iic bias cam=b1', 'iic bias cam=r1', 'iic bias cam=n1'],
+                                               retry=dict(retries=2))
+    engine.start()
+    clock.advance(SchedulerEngine.delayCmd)
+    engine.abort()
+    assert sent == ['iic sps abortExposure']
+
+    cmdRows[0].terminate(code='F', returnStr='aborted')
+    clock.advance(60)
+    assert statuses(cmdRows) == ['failed', 'active', 'valid']
+    assert engine.state != 'off'
+
+    cmdRows[1].terminate(code='F', returnStr='aborted')
+    clock.advance(60)
+    assert statuses(cmdRows) == ['failed', 'failed', 'valid']
+    assert engine.state == 'off'
+    assert not engine.doAbort
+
+
+def test_dependencies_are_awaited(clock, monkeypatch):
+    monkeypatch.setattr(SchedulerEngine, 'lanes', 2)
+    engine, cmdRows, states, sent = queueEngine(clock, [CmdRow('', '', 'iic bias cam=b1', after='arcs'),
+                                                        CmdRow('', '', 'iic arc argon=1 cam=r1', label='arcs'),
+                                                        CmdRow('', '', 'iic bias cam=n1', ifFailed='arcs')])
+    engine.start()
+    clock.advance(SchedulerEngine.delayCmd)
+    assert statuses(cmdRows) == ['valid', 'active', 'valid']
+
+    cmdRows[1].terminate(code=':', returnStr='')
+    clock.advance(SchedulerEngine.delayCmd)
+    assert statuses(cmdRows) == ['active', 'finished', 'cancelled']
+
+
+def test_check_reports_cycles_and_unknown_labels(clock):
+    engine, cmdRows, states, sent = queueEngine(clock, [CmdRow('', '', 'iic bias', label='a', after='b'),
+                                                        CmdRow('', '', 'iic bias', label='b', after='a')])
+    assert 'cycle' in engine.check()
+
+    engine, cmdRows, states, sent = queueEngine(clock, [CmdRow('', '', 'iic bias', label='a', after='missing')])
+    assert 'missing' in engine.check()
+
+
+def test_failed_row_is_retried(clock):
+    engine, cmdRows, states, sent = queueEngine(clock, [CmdRow('a', '', 'iic bias',
+                                                               retry=dict(retries=1, backoff=60, match='timeout')),
+                                                        CmdRow('b', '', 'iic bias')])
+    retried = []
+    engine.connect('retried', lambda cmdRow, retryRow: retried.append(retryRow))
+    engine.start()
+    clock.advance(SchedulerEngine.delayCmd)
+
+    cmdRows[0].terminate(code='F', returnStr='text="timeout"')
+    assert [(cmdRow.name, cmdRow.status, cmdRow.attempt) for cmdRow in cmdRows] == \
+           [('a', 'failed', 0), ('a', 'valid', 1), ('b', 'valid', 0)]
+    assert retried == [cmdRows[1]]
+
+    # with a single lane, the retry is waited for.
+    clock.advance(59)
+    assert statuses(cmdRows) == ['failed', 'valid', 'valid']
+    clock.advance(1)
+    assert statuses(cmdRows) == ['failed', 'active', 'valid']
+
+    cmdRows[1].terminate(code='F', returnStr='text="timeout"')
+    assert len(cmdRows) == 3
+
+
+def test_retry_requeued_at_tail(clock):
+    engine, cmdRows, states, sent = queueEngine(clock, [CmdRow('a', '', 'iic bias', retry=dict(retries=1,
+                                                                                              requeue='tail')),
+                                                        CmdRow('b', '', 'iic bias')])
+    engine.start()
+    clock.advance(SchedulerEngine.delayCmd)
+    cmdRows[0].terminate(code='F', returnStr='')
+
+    assert [cmdRow.name for cmdRow in cmdRows] == ['a', 'b', 'a']
+
+
+def test_unmatched_failure_is_not_retried(clock):
+    engine, cmdRows, states, sent = queueEngine(clock, [CmdRow('a', '', 'iic bias',
+                                                               retry=dict(retries=1, match='timeout'))])
+    engine.start()
+    clock.advance(SchedulerEngine.delayCmd)
+    cmdRows[0].terminate(code='F', returnStr='text="shutter failure"')
+
+    assert statuses(cmdRows) == ['failed']
+    assert engine.state == 'off'
@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta
+
+from sequencePanel.cmdqueue import CmdQueue
+from sequencePanel.eta import DurationModel, QueueETA
+from sequencePanel.sequence import CmdRow
+
+
+def makeETA(tmp_path, cmdRows):
+    return QueueETA(CmdQueue(cmdRows), DurationModel(cachePath=str(tmp_path / 'eta.json')), gap=10)
+
+
+def test_fit_and_cycle(tmp_path):
+    model = DurationModel(cachePath=str(tmp_path / 'eta.json'))
+    t0 = datetime(2024, 1, 1)
+    rows = []
+    for visit in range(4):
+        start = t0 + timedelta(seconds=visit * (30 + 50))
+        rows.append((1, 'biases', visit, start, start + timedelta(seconds=30), 30))
+
+    model.fit(rows)
+    assert model.lastSequenceId == 1
+    assert model.cycle('biases', 30) == 80
+    assert model.cycle('unknown', 10) == 60
+    assert DurationModel(cachePath=str(tmp_path / 'eta.json')).cycle('biases', 30) == 80
+
+
+def test_planned():
+    eta = QueueETA(CmdQueue(), None)
+
+    assert eta.planned(CmdRow('', '', 'iic arc exptime=5,10 duplicate=3')) == (6, 10.0)
+    assert eta.planned(CmdRow('', '', 'iic bias')) == (1, 0.0)
+    assert eta.planned(CmdRow('', '', 'iic arc exptime=long')) == (1, 0.0)
+
+
+def test_update_chains_pending_rows(tmp_path):
+    cmdRows = [CmdRow('', '', 'iic bias duplicate=2'), CmdRow('', '', 'iic bias'), CmdRow('', '', 'iic bias')]
+    eta = makeETA(tmp_path, cmdRows)
+    cmdRows[0].setValid()
+    cmdRows[2].setValid()
+
+    changed = eta.update(now=0)
+    assert changed == [cmdRows[0], cmdRows[2]]
+    assert [cmdRow.eta for cmdRow in cmdRows] == [120, None, 180]
+    assert eta.end == 2 * 60 + 10 + 60 + 10
+
+
+def test_removed_rows_are_released(tmp_path):
+    cmdRows = [CmdRow('', '', 'iic bias'), CmdRow('', '', 'iic bias')]
+    eta = makeETA(tmp_path, cmdRows)
+    for cmdRow in cmdRows:
+        cmdRow.setValid()
+
+    eta.update(now=0)
+    eta.cmdRows.remove([cmdRows[0]])
+
+    assert list(eta.remainings) == [cmdRows[1]]
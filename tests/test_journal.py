@@ -0,0 +1,77 @@
+import json
+
+from sequencePanel.journal import Journal, readRecords
+from sequencePanel.sequence import CmdRow
+
+
+def writeLines(path, lines):
+    with open(path, 'wb') as segment:
+        segment.write(b''.join(lines))
+
+
+def test_truncated_last_line(tmp_path):
+    path = str(tmp_path / 'journal-000000.jsonl')
+    writeLines(path, [b'{"a":1}\n', b'{"a":2}\n', b'{"a":'])
+
+    assert readRecords(path) == [dict(a=1), dict(a=2)]
+    with open(path, 'rb') as segment:
+        assert segment.read() == b'{"a":1}\n{"a":2}\n'
+
+
+def test_damaged_lines(tmp_path):
+    path = str(tmp_path / 'journal-000000.jsonl')
+    writeLines(path, [b'{"a":1}\n', b'\x00\x00\x00\n', b'[1, 2]\n', b'{"a":2}\n'])
+
+    assert readRecords(path) == [dict(a=1), dict(a=2)]
+    assert readRecords(path, skipInvalid=False) == [dict(a=1)]
+
+
+def test_empty_segment(tmp_path):
+    path = str(tmp_path / 'journal-000000.jsonl')
+    writeLines(path, [])
+
+    assert readRecords(path) == []
+
+
+def test_load_skips_incomplete_records(tmp_path):
+    journal = Journal(str(tmp_path))
+    journal.load()
+    cmdRow = CmdRow('bias', '', 'iic bias')
+    journal.row(cmdRow)
+    journal.cmd('iic', 'bias')
+    journal.close()
+
+    with open(journal.segments[-1], 'ab') as segment:
+        for record in [dict(type='row', uid=7), dict(type='reply', t=0), dict(type='row', t=0, uid='x', info={},
+                                                                                seqtype=''), dict(t=0)]:
+            segment.write((json.dumps(record) + '\n').encode())
+
+    journal = Journal(str(tmp_path))
+    records = journal.load()
+    journal.close()
+
+    assert [record['type'] for record in records] == ['row', 'cmd']
+    assert journal.nextUid == cmdRow.uid + 1
+
+
+def test_rotation_keeps_latest_segments(tmp_path, monkeypatch):
+    monkeypatch.setattr(Journal, 'segmentSize', 200)
+    monkeypatch.setattr(Journal, 'keepSegments', 3)
+    journal = Journal(str(tmp_path))
+    journal.load()
+    journal.row(CmdRow('bias', '', 'iic bias'))
+
+    for i in range(50):
+        journal.cmd('iic', 'bias %d' % i)
+    journal.close()
+
+    segments = journal.segments
+    assert len(segments) == 3
+    assert segments[-1].endswith('journal-%06d.jsonl' % (int(segments[0][-12:-6]) + 2))
+
+    # each segment declares the rows it refers to, so that the latest one loads on its own.
+    journal = Journal(str(tmp_path))
+    records = journal.load()
+    journal.close()
+
+    assert records[0]['type'] == 'row'
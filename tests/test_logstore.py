@@ -0,0 +1,52 @@
+import random
+
+from sequencePanel.logstore import LogFilter, LogStore
+
+
+def fill(store, n, seed=2):
+    rng = random.Random(seed)
+    for i in range(n):
+        store.append(float(i), rng.choice(['iic', 'sps', 'hub']), rng.choice(['i', 'w', 'f', ':']),
+                     tuple(rng.sample(['text', 'fileids', 'sps_sequence'], rng.randint(0, 2))), f'line {i}')
+
+
+def test_eviction_keeps_last_records():
+    store = LogStore(capacity=10)
+    fill(store, 25)
+
+    assert len(store) == 10
+    assert store.first == 15
+    assert [store.record(seq)[4] for seq in range(store.first, store.total)] == [f'line {i}' for i in range(15, 25)]
+
+
+def test_indexes_drop_evicted_records():
+    store = LogStore(capacity=10)
+    fill(store, 25)
+
+    for index in [store.byActor, store.byCode, store.byKeyword]:
+        seqs = [seq for values in index.values() for seq in values]
+        assert all([store.first <= seq < store.total for seq in seqs])
+        assert all([len(values) for values in index.values()])
+
+    assert sum([len(values) for values in store.byActor.values()]) == len(store)
+
+
+def test_select_matches_full_scan():
+    store = LogStore(capacity=50)
+    fill(store, 120)
+    filters = [LogFilter(), LogFilter(actor='iic'), LogFilter(codes={'w', 'f'}),
+               LogFilter(actor='sps', keyword='fileids'), LogFilter(search='line 11'),
+               LogFilter(actor='nobody')]
+
+    for logFilter in filters:
+        expected = [seq for seq in range(store.first, store.total) if logFilter.match(*store.record(seq)[1:])]
+        assert store.select(logFilter) == expected
+
+
+def test_overflow():
+    store = LogStore(capacity=10)
+    fill(store, 8)
+
+    assert store.overflow(1) == 0
+    assert store.overflow(5) == 3
+    assert store.overflow(50) == 8
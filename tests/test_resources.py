@@ -0,0 +1,37 @@
+import pytest
+from sequencePanel.resources import Resources, allCameras, lampNames
+
+
+def conflicts(cmdStr, other):
+    return Resources.fromCmdStr(cmdStr).conflicts(Resources.fromCmdStr(other))
+
+
+def test_cameras():
+    assert Resources.fromCmdStr('iic bias').cameras == allCameras
+    assert Resources.fromCmdStr('iic bias cam=b1,r1').cameras == {'b1', 'r1'}
+    assert Resources.fromCmdStr('iic bias specNum=1,2 arm=b').cameras == {'b1', 'b2'}
+    assert Resources.fromCmdStr('iic bias arm=n').cameras == {'n1', 'n2', 'n3', 'n4'}
+
+
+def test_lamps():
+    assert Resources.fromCmdStr('iic bias cam=b1').lamps == set()
+    assert Resources.fromCmdStr('iic arc argon=5 neon=3').lamps == {'argon', 'neon'}
+    assert Resources.fromCmdStr('iic flat exptime=5').lamps == {'halogen'}
+    assert Resources.fromCmdStr('iic someCommand switchOn=hgar,krypton').lamps == {'hgar', 'krypton'}
+    assert Resources.fromCmdStr('iic someCommand').lamps == lampNames
+
+
+@pytest.mark.parametrize('cmdStr, other, expected', [
+    ('iic bias cam=b1', 'iic dark exptime=10 cam=r1', False),
+    ('iic bias cam=b1', 'iic bias cam=b1,r1', True),
+    ('iic bias specNum=1', 'iic bias specNum=2', False),
+    ('iic arc argon=5 cam=b1', 'iic arc neon=5 cam=r1', True),
+    ('iic flat exptime=5 cam=b1', 'iic arc argon=3 cam=r1', True),
+    ('iic flat exptime=5 cam=b1', 'iic bias cam=r1', False),
+    ('iic someCommand cam=b1', 'iic arc hgar=2 cam=r1', True),
+    ('dcb foo', 'dcb bar', True),
+    ('dcb foo', 'iic bias', False),
+])
+def test_conflicts(cmdStr, other, expected):
+    assert conflicts(cmdStr, other) == expected
+    assert conflicts(other, cmdStr) == expected
@@ -0,0 +1,50 @@
+import pytest
+from sequencePanel.retry import RetryPolicies, RetryPolicy
+from sequencePanel.sequence import CmdRow
+
+
+def failed(cmdStr='iic bias', returnStr='', attempt=0, **kwargs):
+    cmdRow = CmdRow('', '', cmdStr, attempt=attempt, **kwargs)
+    cmdRow.returnStr = returnStr
+    cmdRow.setFailed()
+    return cmdRow
+
+
+def test_applies():
+    policy = RetryPolicy(retries=2, match='timeout')
+
+    assert policy.applies(failed(returnStr='text="timeout"'))
+    assert policy.applies(failed(returnStr='text="timeout"', attempt=1))
+    assert not policy.applies(failed(returnStr='text="timeout"', attempt=2))
+    assert not policy.applies(failed(returnStr='text="shutter"'))
+    assert not policy.applies(CmdRow('', '', 'iic bias'))
+
+
+def test_delay():
+    policy = RetryPolicy(retries=3, backoff=30)
+    assert [policy.delay(attempt) for attempt in range(3)] == [30, 60, 120]
+
+
+def test_invalid_requeue():
+    with pytest.raises(ValueError):
+        RetryPolicy(requeue='middle')
+
+
+def test_policies(tmp_path):
+    path = tmp_path / 'retry.yaml'
+    path.write_text('biases:\n  retries: 1\nflat:\n  retries: 2\n  requeue: tail\n')
+    policies = RetryPolicies.load(str(path))
+
+    assert policies.policy(CmdRow('', '', 'iic bias', seqtype='biases')).retries == 1
+    assert policies.policy(CmdRow('', '', 'iic flat exptime=5')).requeue == 'tail'
+    assert policies.policy(CmdRow('', '', 'iic dark exptime=5')) is None
+    assert policies.policy(CmdRow('', '', 'iic bias', seqtype='biases', retry=dict(retries=5))).retries == 5
+    assert RetryPolicies.load(str(tmp_path / 'none.yaml')).bySeqtype == dict()
+
+
+def test_retry_copy():
+    cmdRow = CmdRow('a', '', 'iic bias', label='a', after='b', retry=dict(retries=2))
+    retryRow = cmdRow.retryCopy(startAt=2e9)
+
+    assert (retryRow.label, retryRow.dependsStr, retryRow.attempt, retryRow.startAt) == ('a', 'b', 1, 2e9)
+    assert retryRow.retry.info == cmdRow.retry.info
@@ -0,0 +1,43 @@
+import time
+from datetime import date, datetime, timezone
+
+import pytest
+import yaml
+from sequencePanel.sequence import startTime
+
+
+def test_timestamps():
+    assert startTime(None) is None
+    assert startTime(1.7e9) == 1.7e9
+
+    with pytest.raises(ValueError):
+        startTime(750)
+
+
+def test_dates_are_utc():
+    expected = datetime(2024, 3, 1, 12, 30, tzinfo=timezone.utc).timestamp()
+
+    assert startTime(datetime(2024, 3, 1, 12, 30)) == expected
+    assert startTime('2024-03-01T12:30') == expected
+    assert startTime(' 2024-03-01 12:30:00+00:00 ') == expected
+    assert startTime('2024-03-01T14:30+02:00') == expected
+    assert startTime(date(2024, 3, 1)) == datetime(2024, 3, 1, tzinfo=timezone.utc).timestamp()
+
+
+def test_next_occurrence():
+    now = time.time()
+    start = startTime('12:30')
+    utc = datetime.fromtimestamp(start, timezone.utc)
+
+    assert now < start <= now + 24 * 3600
+    assert (utc.hour, utc.minute, utc.second) == (12, 30, 0)
+
+
+def test_yaml_values():
+    # unquoted HH:MM is a sexagesimal integer for yaml, a timestamp is a datetime.
+    assert yaml.safe_load('startAt: "12:30"')['startAt'] == '12:30'
+    with pytest.raises(ValueError):
+        startTime(yaml.safe_load('startAt: 12:30')['startAt'])
+
+    assert startTime(yaml.safe_load('startAt: 2024-03-01 12:30:00')['startAt']) == \
+           datetime(2024, 3, 1, 12, 30, tzinfo=timezone.utc).timestamp()
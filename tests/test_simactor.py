@@ -0,0 +1,38 @@
+import json
+
+import pytest
+from sequencePanel.simActor import RecordedScript, SyntheticScript
+
+
+def writeSegment(path, records, tail=b''):
+    with open(path, 'wb') as segment:
+        segment.write(b''.join([(json.dumps(record) + '\n').encode() for record in records]) + tail)
+
+
+def test_recorded_script_tolerates_a_crash(tmp_path):
+    path = str(tmp_path / 'journal-000000.jsonl')
+    records = [dict(type='row', t=0, uid=0, info=dict(name='', comments='', cmdStr='iic bias'), seqtype=''),
+               dict(type='reply', t=10, uid=0, actor='iic', code='i', keywords=[], text=''),
+               dict(type='reply', t=15, uid=0, actor='iic', code=':', keywords=[['text', ['done']]], text='')]
+    writeSegment(path, records[:2] + [dict(type='reply', uid=0)] + records[2:], tail=b'{"type":"rep')
+
+    replies = list(RecordedScript(path)('iic', 'bias'))
+    assert [(delay, response.lastCode) for delay, response in replies] == [(0, 'i'), (5, ':')]
+
+    with open(path, 'rb') as segment:
+        assert segment.read().endswith(b'{"type":"rep')
+
+
+def test_recorded_script_without_replies(tmp_path):
+    path = str(tmp_path / 'journal-000000.jsonl')
+    writeSegment(path, [dict(type='cmd', t=0, actor='iic', text='bias')])
+
+    with pytest.raises(ValueError):
+        RecordedScript(path)
+
+
+def test_synthetic_script():
+    replies = list(SyntheticScript()('iic', 'bias duplicate=2 exptime=5'))
+
+    assert [response.lastCode for delay, response in replies] == ['i'] * 5 + [':']
+    assert sum([delay for delay, response in replies]) == 2 * (5 + 60)